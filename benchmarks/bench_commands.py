@@ -0,0 +1,243 @@
+"""
+Offline command microbenchmarks
+
+Drives bot.on_message -> process_commands -> every cog through the fakes in
+benchmarks/fakes.py and a local stub HTTP server, then prints JSON with p50/p99
+latency and peak allocations per command plus mixed workload throughput.
+
+Run from the repository root:
+    python -m benchmarks.bench_commands [--iterations N] [--mixed N] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTENSIONS = ("general", "fun", "moderation", "music", "owner", "help")
+
+# (name, command line, run as owner, needs a fresh user every time)
+WORKLOAD = [
+    ("help", "help", False, False),
+    ("info", "info", False, False),
+    ("ping", "ping", False, False),
+    ("server", "server", False, False),
+    ("serverinfo", "serverinfo", False, False),
+    ("poll", "poll Pineapple on pizza?", False, False),
+    ("dailyfact", "dailyfact", False, True),
+    ("say", "say hello there", False, False),
+    ("embed", "embed hello there", False, False),
+    ("warn", "warn {target} spamming", False, False),
+    ("kick", "kick {target} spamming", False, False),
+    ("ban", "ban {target} spamming", False, False),
+    ("nick", "nick {target} Renamed", False, False),
+    ("purge", "purge 25", False, False),
+    ("play", "play never gonna give you up", False, False),
+    ("queue", "queue", False, False),
+    ("playing", "playing", False, False),
+    ("blacklist", "blacklist", True, False),
+    ("status", "status", True, False),
+    ("metrics", "metrics", True, False),
+    ("musicstats", "musicstats", True, False),
+]
+
+
+async def start_stub_server():
+    """Serve the dailyfact API locally, returns (runner, url)"""
+
+    async def random_fact(_request):
+        return web.json_response({"text": "Benchmarks are facts too."})
+
+    app = web.Application()
+    app.router.add_get("/random.json", random_fact)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/random.json"
+
+
+def percentile(samples, q: float):
+    """Nearest-rank percentile"""
+
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Harness:
+    """Bot with every cog loaded against fakes"""
+
+    def __init__(self, tg9, fakes):
+        self.tg9 = tg9
+        self.fakes = fakes
+        self.bot = tg9.bot
+        self.prefix = self.bot.config.prefix
+        bot_user = fakes.install(self.bot)
+        self.guild = fakes.FakeGuild(bot_user)
+        self.guild.add_member(bot_user)
+        self.owner = self.guild.add_member(
+            fakes.FakeUser(min(self.bot.config.owners), name="owner"))
+        self.user = self.guild.add_member(fakes.FakeUser(name="member"))
+        self.target = self.guild.add_member(fakes.FakeUser(name="target"))
+        self.music = self.bot.get_cog("music")
+        self.music._extractor = fakes.FakeExtractor()
+
+    async def start_music(self):
+        """Connect to voice and put a song on, so queue and playing have something to show"""
+
+        await self.run(self.message("play warm up song"))
+        player = self.music.players[self.guild.id]
+        # The player loop waits for a ready gateway and never starts FFmpeg here
+        player.current = player.queue[0]
+        player.now_playing_msg = await self.guild.channel.send("Now Playing")
+        self.guild.voice_client.play(None)
+
+    def message(self, line: str, *, owner: bool = False, fresh: bool = False):
+        """Message in the fake guild"""
+
+        author = self.owner if owner else self.user
+        if fresh:
+            author = self.guild.add_member(self.fakes.FakeUser(name="member"))
+        content = self.prefix + line.format(target=self.target.mention)
+        return self.fakes.FakeMessage(content, author=author, channel=self.guild.channel)
+
+    async def run(self, message):
+        """Feed one message through on_message, returns seconds taken"""
+
+        start = time.perf_counter()
+        await self.tg9.on_message(message)
+        return time.perf_counter() - start
+
+    async def bench_command(self, entry, iterations: int):
+        """Latency and allocation numbers of one command"""
+
+        name, line, owner, fresh = entry
+        for _ in range(3):  # Warm up caches and lazy imports
+            await self.run(self.message(line, owner=owner, fresh=fresh))
+        timings = [await self.run(self.message(line, owner=owner, fresh=fresh))
+                   for _ in range(iterations)]
+
+        # Allocations are measured in a separate pass, tracing skews timings
+        peaks = []
+        tracemalloc.start()
+        for _ in range(min(iterations, 50)):
+            message = self.message(line, owner=owner, fresh=fresh)
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            await self.run(message)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+
+        return name, {
+            "iterations": iterations,
+            "p50_ms": percentile(timings, 0.50) * 1000,
+            "p99_ms": percentile(timings, 0.99) * 1000,
+            "mean_ms": statistics.fmean(timings) * 1000,
+            "alloc_peak_kb": statistics.fmean(peaks) / 1024,
+        }
+
+    async def bench_mixed(self, count: int, command_ratio: float = 0.3):
+        """Throughput of chat with a share of random commands"""
+
+        rng = random.Random(9)
+        messages = []
+        for _ in range(count):
+            if rng.random() < command_ratio:
+                _, line, owner, fresh = rng.choice(WORKLOAD)
+                messages.append(self.message(line, owner=owner, fresh=fresh))
+            else:
+                messages.append(self.fakes.FakeMessage("just chatting", author=self.user,
+                                                       channel=self.guild.channel))
+        start = time.perf_counter()
+        for message in messages:
+            await self.tg9.on_message(message)
+        elapsed = time.perf_counter() - start
+        return {
+            "messages": count,
+            "command_ratio": command_ratio,
+            "seconds": elapsed,
+            "messages_per_second": count / elapsed,
+        }
+
+
+async def main(args):
+    """Set up a scratch working directory, the bot and the stub server, then benchmark"""
+
+    workdir = tempfile.mkdtemp(prefix="tg9-bench-")
+    for name in ("config.json", "blacklist.json"):
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    import bot as tg9
+    from benchmarks import fakes
+
+    runner, stub_url = await start_stub_server()
+    tg9.bot.config.document.data.setdefault("api", {})["dailyfact"] = stub_url
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "commands": {},
+    }
+    try:
+        async with tg9.bot:
+            tg9.bot.http_client = tg9.HTTPClient.from_config(tg9.bot.config)
+            await tg9.bot.http_client.start()
+            for extension in EXTENSIONS:
+                await tg9.bot.load_extension(f"cogs.{extension}")
+            harness = Harness(tg9, fakes)
+            await harness.start_music()
+            for entry in WORKLOAD:
+                if args.only and entry[0] not in args.only:
+                    continue
+                name, stats = await harness.bench_command(entry, args.iterations)
+                results["commands"][name] = stats
+            results["mixed"] = await harness.bench_mixed(args.mixed)
+            # Completion events run as their own tasks, let the last ones log
+            await asyncio.sleep(0.1)
+    finally:
+        # Writes out what is queued, the console handler prints into the captured stdout
+        tg9.log_pipeline.stop()
+        await runner.cleanup()
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def report(results, output: str = None):
+    """Print the results as JSON, or write them to output"""
+
+    payload = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--mixed", type=int, default=5000)
+    parser.add_argument("--only", nargs="*", help="Only benchmark these commands")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+    # Command replies and log lines go here, stdout only gets the JSON
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(main(args))
+    report(results, args.output)
@@ -0,0 +1,109 @@
+"""
+Benchmark idle music players: a task and timer each versus one timer wheel
+
+The old player kept a task per guild waiting on its queue under a 300 second
+timeout. Now a player without songs has no task, and the music cog keeps one
+TimerWheel of idle deadlines that a single loop expires every few seconds.
+
+Run from the repository root:
+    python -m benchmarks.bench_idle_players [players ...]
+"""
+
+import asyncio
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from helpers.song_queue import SongQueue
+from helpers.timer_wheel import TimerWheel
+
+IDLE_TIMEOUT = 300.0
+IDLE_TICK = 5.0
+
+
+async def legacy_player(queue: SongQueue):
+    """Idle part of the old player loop"""
+
+    try:
+        await asyncio.wait_for(queue.get(), IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def loop_lag(samples: int = 2000):
+    """Mean seconds per event loop iteration"""
+
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(samples):
+        await asyncio.sleep(0)
+    return (time.perf_counter() - start) / samples
+
+
+async def legacy(count: int):
+    """Memory and loop overhead of count idle players with their own tasks"""
+
+    gc.collect()
+    tracemalloc.start()
+    queues = [SongQueue() for _ in range(count)]
+    tasks = [asyncio.create_task(legacy_player(queue)) for queue in queues]
+    await asyncio.sleep(0.1)  # Let every task reach its wait
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    result = {
+        "memory_kb": memory / 1024,
+        "tasks": len(asyncio.all_tasks()) - 1,
+        "timer_handles": len(asyncio.get_running_loop()._scheduled),
+        "loop_iteration_us": await loop_lag() * 1e6,
+    }
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return result
+
+
+async def wheel(count: int):
+    """Memory and loop overhead of count idle players on one timer wheel"""
+
+    gc.collect()
+    tracemalloc.start()
+    queues = [SongQueue() for _ in range(count)]
+    idle = TimerWheel(IDLE_TICK, int(IDLE_TIMEOUT // IDLE_TICK) + 1)
+    now = time.monotonic()
+    for guild_id in range(count):
+        # Spread over the timeout like players that went idle at different times
+        idle.schedule(guild_id, now + IDLE_TIMEOUT * (guild_id + 1) / count)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Cost of the single idle loop: one pass per tick over a full timeout
+    start = time.perf_counter()
+    expired = 0
+    passes = int(IDLE_TIMEOUT // IDLE_TICK) + 1
+    for number in range(1, passes + 1):
+        expired += len(idle.expire(now + number * IDLE_TICK))
+    assert expired == count, expired
+    del queues
+    return {
+        "memory_kb": memory / 1024,
+        "tasks": len(asyncio.all_tasks()) - 1,
+        "timer_handles": len(asyncio.get_running_loop()._scheduled),
+        "loop_iteration_us": await loop_lag() * 1e6,
+        "expire_pass_us": (time.perf_counter() - start) / passes * 1e6,
+    }
+
+
+async def main(counts):
+    """Compare both designs for every player count"""
+
+    results = {}
+    for count in counts:
+        wheel_result = await wheel(count)  # First, so the legacy tasks leave no garbage behind
+        results[count] = {"legacy": await legacy(count), "wheel": wheel_result}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [1000, 10000]))
@@ -0,0 +1,59 @@
+"""
+Benchmark messages per second through on_message
+
+Run from the repository root:
+    python -m benchmarks.bench_on_message [messages]
+"""
+
+import asyncio
+import json
+import sys
+import time
+from types import SimpleNamespace
+
+import bot as tg9
+
+
+async def legacy_on_message(message):
+    """on_message as it was before the in-memory blacklist"""
+
+    if message.author == tg9.bot.user or message.author.bot:
+        return
+    with open("blacklist.json", encoding="utf-8") as infile:
+        blacklist = json.load(infile)
+    if message.author.id in blacklist["ids"]:
+        return
+    await tg9.bot.process_commands(message)
+
+
+async def run(handler, messages):
+    """Feed messages through a handler and return messages per second"""
+
+    start = time.perf_counter()
+    for message in messages:
+        await handler(message)
+    return len(messages) / (time.perf_counter() - start)
+
+
+async def main(count: int):
+    """Compare the legacy handler with the current one"""
+
+    async def process_commands(_message):
+        return None
+
+    # Only the blacklist gate is measured, command dispatch is stubbed out
+    tg9.bot.process_commands = process_commands
+    messages = [
+        SimpleNamespace(author=SimpleNamespace(id=100000 + i % 500, bot=False),
+                        content="hello")
+        for i in range(count)
+    ]
+    before = await run(legacy_on_message, messages)
+    after = await run(tg9.on_message, messages)
+    print(f"before: {before:,.0f} msg/s")
+    print(f"after:  {after:,.0f} msg/s")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
@@ -0,0 +1,71 @@
+"""
+Benchmark time-to-interactive of poll and rps reactions
+
+Compares awaiting add_reaction one call at a time with the background
+ReactionPipeline against FakeMessage with a simulated REST round trip.
+
+Run from the repository root:
+    python -m benchmarks.bench_reactions [latency_ms] [rounds]
+"""
+
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from benchmarks.fakes import FakeMessage
+from helpers.reactions import add_reactions
+
+COMMANDS = {
+    "poll": ("👍", "👎", "🤷"),
+    "rps": ("🪨", "🧻", "✂"),
+}
+
+
+async def sequential(message, emojis):
+    """The old way, returns once every reaction is added"""
+
+    for emoji in emojis:
+        await message.add_reaction(emoji)
+
+
+async def pipelined(message, emojis):
+    """The helper, returns right away"""
+    return add_reactions(message, *emojis)
+
+
+async def measure(latency: float, emojis, rounds: int):
+    """Time until the command can accept input and until every reaction shows"""
+
+    results = {}
+    for name, strategy in (("sequential", sequential), ("pipelined", pipelined)):
+        interactive, complete = [], []
+        for _ in range(rounds):
+            message = FakeMessage(latency=latency)
+            start = time.perf_counter()
+            pipeline = await strategy(message, emojis)
+            interactive.append(time.perf_counter() - start)
+            if pipeline is not None:
+                await pipeline.wait()
+            complete.append(time.perf_counter() - start)
+            assert message.reactions == list(emojis)
+        results[name] = {
+            "interactive_ms": statistics.median(interactive) * 1000,
+            "complete_ms": statistics.median(complete) * 1000,
+        }
+    return results
+
+
+async def main(latency_ms: float, rounds: int):
+    """Benchmark every command"""
+
+    output = {"latency_ms": latency_ms, "rounds": rounds, "commands": {}}
+    for command, emojis in COMMANDS.items():
+        output["commands"][command] = await measure(latency_ms / 1000, emojis, rounds)
+    print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 120.0,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 10))
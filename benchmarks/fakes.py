@@ -0,0 +1,331 @@
+"""
+In-process stand-ins for the discord.py objects commands touch
+
+They implement only what the cogs use, so commands can be driven through
+bot.on_message without a gateway or REST connection.
+"""
+
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import discord
+from discord.ext import commands
+
+from helpers.extractor import ExtractorStats
+
+_ids = itertools.count(900000000000000000)
+
+
+def snowflake():
+    """Unique fake ID"""
+    return next(_ids)
+
+
+class FakeVoiceState:
+    """Voice state of a member sitting in a voice channel"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.self_mute = self.self_deaf = False
+
+
+class FakeUser:
+    """User or Member"""
+
+    def __init__(self, user_id: int = None, name: str = "user", *, bot: bool = False,
+                 guild=None, administrator: bool = False):
+        self.id = user_id or snowflake()
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.guild = guild
+        self.voice = None
+        self.mention = f"<@{self.id}>"
+        self.display_avatar = SimpleNamespace(url="https://cdn.discordapp.com/embed/avatars/0.png")
+        self.guild_permissions = discord.Permissions(administrator=administrator)
+        self.sent = []
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, *args, **kwargs):
+        """DM the user"""
+        self.sent.append((args, kwargs))
+
+    async def kick(self, **_kwargs):
+        """Kick the member"""
+
+    async def ban(self, **_kwargs):
+        """Ban the member"""
+
+    async def edit(self, **_kwargs):
+        """Edit the member"""
+
+
+class FakeMessage:
+    """Message with an optional simulated REST latency for reactions"""
+
+    def __init__(self, content: str = "", *, author=None, channel=None, latency: float = 0.0):
+        self.id = snowflake()
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = getattr(channel, "guild", None)
+        self.mentions = []
+        self.attachments = []
+        self.embeds = []
+        self.reactions = []
+        self.created_at = datetime.now(timezone.utc)
+        self.edited_at = None
+        self.latency = latency
+        self._state = None
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def add_reaction(self, emoji):
+        """React to the message"""
+
+        await self._round_trip()
+        self.reactions.append(str(emoji))
+
+    async def clear_reactions(self):
+        """Remove every reaction"""
+
+        await self._round_trip()
+        self.reactions.clear()
+
+    async def edit(self, *, embed=None, **_kwargs):
+        """Edit the message"""
+
+        await self._round_trip()
+        if embed is not None:
+            self.embeds = [embed]
+
+    async def delete(self, **_kwargs):
+        """Delete the message"""
+        await self._round_trip()
+
+
+class FakeChannel:
+    """Text channel that keeps what was sent to it"""
+
+    def __init__(self, guild=None, *, latency: float = 0.0):
+        self.id = snowflake()
+        self.name = "general"
+        self.type = discord.ChannelType.text
+        self.guild = guild
+        self.latency = latency
+        self.sent = []
+
+    def permissions_for(self, _member):
+        """Everybody may do everything"""
+        return discord.Permissions.all()
+
+    async def send(self, content=None, *, embed=None, **_kwargs):
+        """Send a message"""
+
+        message = FakeMessage(content or "", author=self.guild.me if self.guild else None,
+                              channel=self, latency=self.latency)
+        if embed is not None:
+            message.embeds = [embed]
+        self.sent.append(message)
+        return message
+
+    async def history(self, *, limit: int = 100, **_kwargs):
+        """Stream limit made-up messages"""
+
+        author = FakeUser(name="chatter")
+        for _ in range(limit):
+            yield FakeMessage("chatter", author=author, channel=self)
+
+    async def delete_messages(self, messages, **_kwargs):
+        """Bulk delete messages"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeVoiceClient:
+    """Connected voice client, playback only flips flags"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.guild = channel.guild
+        self.source = None
+        self._playing = False
+        self._paused = False
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self._playing
+
+    def is_paused(self):
+        return self._paused
+
+    def play(self, source, *, after=None, **_kwargs):
+        """Start playing source"""
+
+        self.source = source
+        self._playing = True
+
+    def stop(self):
+        """Stop playing"""
+        self._playing = self._paused = False
+
+    def pause(self):
+        """Pause playback"""
+        self._paused = True
+
+    def resume(self):
+        """Resume playback"""
+        self._paused = False
+
+    async def move_to(self, channel, **_kwargs):
+        """Move to another voice channel"""
+        self.channel = channel
+
+    async def disconnect(self, **_kwargs):
+        """Leave voice"""
+
+        self.stop()
+        self.guild.voice_client = None
+
+
+class FakeVoiceChannel:
+    """Voice channel that connects without a voice gateway"""
+
+    def __init__(self, guild):
+        self.id = snowflake()
+        self.name = "Music"
+        self.type = discord.ChannelType.voice
+        self.guild = guild
+
+    async def connect(self, **_kwargs):
+        """Join the channel"""
+
+        self.guild.voice_client = FakeVoiceClient(self)
+        return self.guild.voice_client
+
+
+class FakeExtractor:
+    """youtube-dl stand-in answering every query with the same Opus song"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.stats = ExtractorStats()
+
+    async def extract(self, query: str, options: dict = None):
+        """Info of a made-up video"""
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.stats.record(0.0, self.latency)
+        video_id = "dQw4w9WgXcQ"
+        return {
+            "id": video_id,
+            "title": f"Result for {query}",
+            "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+            "duration": 213,
+            "formats": [{
+                "url": f"https://rr1.googlevideo.com/videoplayback?expire=4102444800&id={video_id}",
+                "ext": "webm",
+                "acodec": "opus",
+                "vcodec": "none",
+                "abr": 160,
+            }],
+        }
+
+    def shutdown(self):
+        """Nothing to stop"""
+
+
+class FakeGateway:
+    """Stands in for bot.ws so latency reads work offline"""
+
+    open = False
+    latency = 0.042
+
+    def is_ratelimited(self):
+        return False
+
+
+class FakeGuild:
+    """Guild with one text channel and one voice channel"""
+
+    def __init__(self, bot_user, *, latency: float = 0.0):
+        self.id = snowflake()
+        self.name = "Benchmark Guild"
+        self.me = bot_user
+        self.owner = FakeUser(name="owner", guild=self)
+        self.members = {}
+        self.roles = [SimpleNamespace(name=f"role{i}") for i in range(10)]
+        self.channels = []
+        self.member_count = 0
+        self.icon = SimpleNamespace(url="https://cdn.discordapp.com/icons/0/0.png")
+        self.created_at = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        self.voice_client = None
+        self.channel = FakeChannel(self, latency=latency)
+        self.voice_channel = FakeVoiceChannel(self)
+        self.channels += [self.channel, self.voice_channel]
+
+    def __str__(self):
+        return self.name
+
+    def add_member(self, member: FakeUser):
+        """Add a member so converters can find it"""
+
+        member.guild = self
+        if not member.bot:
+            member.voice = FakeVoiceState(self.voice_channel)
+        self.members[member.id] = member
+        self.member_count = len(self.members)
+        return member
+
+    def get_member(self, member_id: int):
+        """Member by ID"""
+        return self.members.get(member_id)
+
+
+class FakeMemberConverter(commands.Converter):
+    """Resolves <@id> mentions against FakeGuild.members"""
+
+    async def convert(self, ctx, argument: str):
+        member_id = int(argument.strip("<@!>"))
+        member = ctx.guild.get_member(member_id)
+        if member is None:
+            raise commands.MemberNotFound(argument)
+        return member
+
+
+class FakeContext(commands.Context):
+    """Context whose send goes to the fake channel instead of the REST API"""
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+def install(bot):
+    """Point a bot at the fakes, returns the fake bot user"""
+
+    bot_user = FakeUser(name="Tg9", bot=True)
+    bot._connection.user = bot_user
+    bot.ws = FakeGateway()
+    commands.converter.CONVERTER_MAPPING[discord.Member] = FakeMemberConverter
+    original = type(bot).get_context
+
+    async def get_context(origin, /, *, cls=FakeContext):
+        return await original(bot, origin, cls=cls)
+
+    bot.get_context = get_context
+    return bot_user
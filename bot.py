@@ -6,20 +6,33 @@ Version: 1.3v
 ------------------------------------------------------------------------------
 """
 
-import json
+import asyncio
+import importlib
 import os
 import platform
 import random
+import time
 
 import discord
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
 
-from helpers import exceptions
+from helpers import exceptions, persistence
+from helpers.blacklist import blacklist
+from helpers.config import Config
+from helpers.cooldowns import cooldowns
+from helpers.http_client import HTTPClient
+from helpers.ipc import IPCClient
+from helpers.lag_monitor import LagMonitor
+from helpers.logger import context_fields, log, setup_logging
+from helpers.metrics import Metrics, MetricsServer
+from helpers.startup import ImportTimer, StartupReport
 
 # Get configuration
-with open("config.json", encoding="utf-8") as file:
-    config = json.load(file)
+config = Config()
+
+# Log through a queue so slow stdout or disk never blocks the event loop
+log_pipeline = setup_logging(config)
 
 # Get token of bot
 load_dotenv()
@@ -29,50 +42,290 @@ TOKEN = os.environ.get("TOKEN")
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(command_prefix=commands.when_mentioned_or(config["bot_prefix"]), intents=intents)
+
+class Tg9Bot(commands.Bot):
+    """Bot which owns the shared HTTP client and writes pending JSON changes on shutdown"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http_client = None
+        self.metrics = Metrics()
+        self.metrics_server = None
+        self.lag_monitor = None  # Set in setup_hook when lag_monitor is enabled
+        self.ipc = None  # Set when running as a cluster under launcher.py
+        self.cog_registry_version = 0  # Bumped when a cog is added or removed
+        self.startup = StartupReport()
+        self.reloading = None  # Name of the extension being reloaded
+        self.handover = {}  # Extension name -> state its old cog passes to the new one
+
+    async def reload_extension(self, name, /, **kwargs):
+        self.reloading = name
+        try:
+            await super().reload_extension(name, **kwargs)
+        finally:
+            self.reloading = None
+            self.handover.pop(name, None)
+
+    async def add_cog(self, cog, /, **kwargs):
+        await super().add_cog(cog, **kwargs)
+        self.cog_registry_version += 1
+
+    async def remove_cog(self, name, /, **kwargs):
+        cog = await super().remove_cog(name, **kwargs)
+        self.cog_registry_version += 1
+        return cog
+
+    async def broadcast(self, op: str, data=None):
+        """Run an owner action on every other cluster, no-op without a launcher"""
+
+        if self.ipc is not None:
+            await self.ipc.broadcast(op, data)
+
+    async def get_context(self, origin, /, *, cls=commands.Context):
+        received_at = time.perf_counter()
+        ctx = await super().get_context(origin, cls=cls)
+        ctx.received_at = received_at  # Start of the command latency histogram
+        return ctx
+
+    async def close(self):
+        await persistence.flush()
+        await cooldowns.save()
+        await super().close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        if self.http_client is not None:
+            await self.http_client.close()
+        if self.ipc is not None:
+            await self.ipc.close()
+        if self.lag_monitor is not None:
+            self.lag_monitor.stop()
+        log_pipeline.stop()
+
+
+def get_prefix(client: commands.Bot, message: discord.Message):
+    """Prefixes are read on every message so a config reload applies at once"""
+
+    return commands.when_mentioned_or(*client.config.prefixes)(client, message)
+
+
+class ShardedTg9Bot(Tg9Bot, commands.AutoShardedBot):
+    """Tg9Bot running one or more shards in this process"""
+
+
+def create_bot():
+    """Sharded bot when sharding is enabled or launcher.py passed shards, else a plain bot"""
+
+    sharding = config.get("sharding", {})
+    shard_ids = os.environ.get("SHARD_IDS")
+    shard_ids = [int(i) for i in shard_ids.split(",")] if shard_ids else sharding.get("shard_ids")
+    shard_count = os.environ.get("SHARD_COUNT")
+    shard_count = int(shard_count) if shard_count else sharding.get("shard_count")
+    if not sharding.get("enabled") and shard_ids is None:
+        return Tg9Bot(command_prefix=get_prefix, intents=intents)
+    if shard_ids is not None and shard_count is None:
+        # The other shards may run elsewhere, so the total cannot be derived from our ids
+        raise exceptions.ConfigError("`sharding.shard_count` (or SHARD_COUNT) is required "
+                                     "when shard ids are given")
+    return ShardedTg9Bot(command_prefix=get_prefix, intents=intents,
+                         shard_ids=shard_ids, shard_count=shard_count)
+
+
+bot = create_bot()
 
 # Remove the default help command of discord.py
 bot.remove_command("help")
 bot.config = config
+bot.blacklist = blacklist
+
+
+def music_players():
+    """Music players of the music cog, empty if it is not loaded"""
+
+    music = bot.get_cog("music")
+    return music.players.values() if music is not None else ()
+
+
+def ffmpeg_budget(field: str):
+    """One value of the FFmpeg budget summary, empty until music played"""
+
+    music = bot.get_cog("music")
+    if music is None or music._ffmpeg_budget is None:
+        return ()
+    return (music._ffmpeg_budget.summary()[field],)
+
+
+bot.metrics.gauge("tg9_guilds", "Guilds the bot is in", lambda: len(bot.guilds))
+bot.metrics.gauge("tg9_gateway_latency_seconds", "Gateway heartbeat latency",
+                  lambda: bot.latency)
+bot.metrics.gauge("tg9_music_players", "Active music players",
+                  lambda: len(music_players()))
+bot.metrics.gauge("tg9_music_queued_songs", "Songs queued across all music players",
+                  lambda: sum(len(player.queue) for player in music_players()))
+bot.metrics.gauge("tg9_log_dropped", "Log records dropped because the log queue was full",
+                  lambda: log_pipeline.dropped)
+bot.metrics.gauge("tg9_log_sampled_out", "Log records skipped by sampling",
+                  lambda: log_pipeline.sampler.sampled_out)
+bot.metrics.gauge("tg9_ffmpeg_processes", "FFmpeg processes holding a budget slot",
+                  lambda: sum(ffmpeg_budget("running")))
+bot.metrics.gauge("tg9_ffmpeg_waiting", "Guilds waiting for an FFmpeg slot",
+                  lambda: sum(ffmpeg_budget("waiting")))
+bot.metrics.gauge("tg9_cooldown_keys", "Users or guilds on a persistent cooldown",
+                  lambda: sum(cooldowns.summary().values()))
+bot.metrics.gauge("tg9_event_loop_lag_seconds", "Event loop lag at the last heartbeat",
+                  lambda: bot.lag_monitor.last_lag if bot.lag_monitor is not None else 0)
+bot.metrics.gauge("tg9_event_loop_stalls", "Event loop stalls over the lag threshold",
+                  lambda: bot.lag_monitor.stalls if bot.lag_monitor is not None else 0)
+
+
+def cluster_health():
+    """Health report sent to the launcher"""
+
+    return {
+        "pid": os.getpid(),
+        "shards": sorted(bot.shards) if isinstance(bot, commands.AutoShardedBot) else [0],
+        "ready": bot.is_ready(),
+        "guilds": len(bot.guilds),
+        "latency": bot.latency,
+        "music_players": len(music_players()),
+        "commands": sum(bot.metrics.command_latency.count(*labels)
+                        for labels in bot.metrics.command_latency.series),
+    }
+
+
+async def ipc_status_set(data):
+    """Another cluster set the status"""
+
+    await bot.change_presence(status=discord.Status.idle, activity=discord.Game(data["status"]))
+
+
+async def ipc_blacklist(data):
+    """Another cluster changed the blacklist"""
+
+    bot.blacklist.sync(data["user_id"], data["blacklisted"])
+
+
+async def ipc_shutdown(_data):
+    """The launcher or another cluster is shutting down"""
+
+    # Not awaited, close() cancels the IPC task this handler runs in
+    bot.loop.create_task(bot.close())
+
+
+def record_command(ctx: commands.Context, error=None):
+    """Record command latency, and the error type if it failed"""
+
+    name = ctx.command.qualified_name if ctx.command else "unknown"
+    received_at = getattr(ctx, "received_at", None)
+    if ctx.command is not None and received_at is not None:
+        bot.metrics.command_latency.observe(time.perf_counter() - received_at, name)
+    if error is not None:
+        error = getattr(error, "original", error)
+        bot.metrics.command_errors.inc(name, type(error).__name__)
 
 
 @bot.event
 async def on_ready():
     """This is executed when the bot is ready"""
 
-    print(f"Logged in as {bot.user.name}")
-    print(f"Discord.py API version: {discord.__version__}")
-    print(f"Python version: {platform.python_version()}")
-    print(f"Running on: {platform.system()} {platform.release()} ({os.name})")
-    print("-------------------")
-    status_task.start()
+    log.info("Logged in as %s", bot.user.name, extra={"event": "ready"})
+    log.info("Discord.py API version: %s", discord.__version__, extra={"event": "ready"})
+    log.info("Python version: %s", platform.python_version(), extra={"event": "ready"})
+    log.info("Running on: %s %s (%s)", platform.system(), platform.release(), os.name,
+             extra={"event": "ready"})
+    bot.startup.ready()
+    log.info("Ready %.2fs after process start", bot.startup.ready_at, extra={"event": "ready"})
+    # on_ready fires again after a reconnect that could not resume
+    for task in (status_task, watch_task, cooldown_snapshot_task):
+        if not task.is_running():
+            task.start()
 
 
 @bot.event
 async def setup_hook():
     """Load our modules when the bot is run"""
 
-    for infile in os.listdir("./cogs"):
-        if infile.endswith(".py"):
-            extension = infile[:-3]
-            try:
-                await bot.load_extension(f"cogs.{extension}")
-                print(f"Loaded extension '{extension}'")
-            except Exception as e:  # If module fails to load, let us know the error
-                exception = f"{type(e).__name__}: {e}"
-                print(f"Failed to load extension {extension}\n{exception}")
+    bot.lag_monitor = LagMonitor.from_config(bot.config)
+    if bot.lag_monitor is not None:
+        bot.lag_monitor.start()
+    bot.http_client = HTTPClient.from_config(bot.config)
+    await bot.http_client.start()
+    if os.environ.get("CLUSTER_IPC"):
+        host, port = os.environ["CLUSTER_IPC"].rsplit(":", 1)
+        bot.ipc = IPCClient(host, int(port), int(os.environ.get("CLUSTER_ID", 0)),
+                            health_provider=cluster_health)
+        bot.ipc.handlers.update(status_set=ipc_status_set, blacklist=ipc_blacklist,
+                                shutdown=ipc_shutdown)
+        await bot.ipc.start()
+    metrics_config = bot.config.get("metrics", {})
+    if metrics_config.get("enabled"):
+        bot.metrics_server = MetricsServer(bot.metrics,
+                                           host=metrics_config.get("host", "127.0.0.1"),
+                                           port=metrics_config.get("port", 9090))
+        await bot.metrics_server.start()
+    extensions = sorted(infile[:-3] for infile in os.listdir("./cogs") if infile.endswith(".py"))
+    # Extensions are independent, so their imports run in worker threads side by side
+    with ImportTimer() as timer:
+        await asyncio.gather(*(load_extension(extension) for extension in extensions))
+    bot.startup.imports = timer.times
+    bot.startup.setup_done()
     # await bot.tree.sync()
 
 
+def import_extension(extension: str):
+    """Import an extension module and its dependencies, returns the seconds taken"""
+
+    start = time.perf_counter()
+    importlib.import_module(f"cogs.{extension}")
+    return time.perf_counter() - start
+
+
+async def load_extension(extension: str):
+    """Load one extension, recording how long its import and setup took"""
+
+    loop = asyncio.get_running_loop()
+    try:
+        bot.startup.extension(extension, "import",
+                              await loop.run_in_executor(None, import_extension, extension))
+        start = time.perf_counter()
+        await bot.load_extension(f"cogs.{extension}")
+        bot.startup.extension(extension, "setup", time.perf_counter() - start)
+        log.info("Loaded extension '%s'", extension, extra={"event": "extension"})
+    except Exception as e:  # If module fails to load, let us know the error
+        bot.startup.failed[extension] = f"{type(e).__name__}: {e}"
+        log.error("Failed to load extension %s\n%s: %s", extension, type(e).__name__, e,
+                  extra={"event": "extension"})
+
+
 @tasks.loop(minutes=60.0)  # Change status after 60 minutes
 async def status_task():
     """Setup the game status task of the bot"""
 
-    with open("config.json", encoding="utf-8") as infile:
-        body = json.load(infile)
-        status = random.choice(body["statuses"])
-        await bot.change_presence(status=discord.Status.idle,
-                                  activity=discord.Game(status))
+    status = random.choice(bot.config.statuses)
+    await bot.change_presence(status=discord.Status.idle,
+                              activity=discord.Game(status))
+
+
+@tasks.loop(minutes=5.0)
+async def cooldown_snapshot_task():
+    """Snapshot persistent cooldowns so a crash loses at most a few minutes of them"""
+
+    try:
+        await cooldowns.save()
+    except OSError as e:
+        log.warning("Could not save cooldowns: %s", e, extra={"event": "cooldowns"})
+
+
+@tasks.loop(seconds=5.0)  # Check the JSON files for external edits
+async def watch_task():
+    """Reload blacklist.json and config.json when they were edited outside the bot"""
+
+    for name, document in (("blacklist", bot.blacklist), ("config", bot.config)):
+        try:
+            if await document.refresh():
+                log.info("Reloaded %s", name, extra={"event": "reload"})
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning("Ignoring invalid %s edit\n%s: %s", name, type(e).__name__, e,
+                        extra={"event": "reload"})
 
 
 @bot.event
@@ -83,9 +336,7 @@ async def on_message(message: discord.Message):
     if message.author == bot.user or message.author.bot:
         return
     # Ignore if a command is being executed by a blacklisted user
-    with open("blacklist.json", encoding="utf-8") as infile:
-        blacklist = json.load(infile)
-    if message.author.id in blacklist["ids"]:
+    if message.author.id in bot.blacklist:
         return
     await bot.process_commands(message)
 
@@ -94,17 +345,20 @@ async def on_message(message: discord.Message):
 async def on_command_completion(ctx: commands.Context):
     """This is executed every time a command has been successfully executed"""
 
-    full_command_name = ctx.command.qualified_name
-    split = full_command_name.split(" ")
-    executed_command = str(split[0])
-    print(f"Executed {executed_command} command in {ctx.guild.name} (ID: {ctx.message.guild.id})"
-          f" by {ctx.message.author} (ID: {ctx.message.author.id})")
+    record_command(ctx)
+    if not log_pipeline.wants("command_completion"):
+        return
+    fields = context_fields(ctx, "command_completion")
+    log.info("Executed %s command in %s (ID: %s) by %s (ID: %s)",
+             fields["command"], fields["guild"], fields["guild_id"],
+             fields["user"], fields["user_id"], extra={**fields, "presampled": True})
 
 
 @bot.event
 async def on_command_error(ctx: commands.Context, error):
     """This is executed every time a valid command catches an error"""
 
+    record_command(ctx, error)
     if isinstance(error, commands.MissingRequiredArgument):
         args = ""
         args = [args.join(i) for i in str(error).split("_")]
@@ -125,9 +379,12 @@ async def on_command_error(ctx: commands.Context, error):
         await ctx.send(embed=embed)
 
     elif isinstance(error, commands.CommandNotFound):
-        err = str(error.args).split(',')[0]
-        print(f"Unknown command {err} in {ctx.guild.name} (ID: {ctx.message.guild.id})"
-              f" by {ctx.message.author} (ID: {ctx.message.author.id})")
+        if log_pipeline.wants("command_not_found"):
+            err = str(error.args).split(',')[0]
+            fields = context_fields(ctx, "command_not_found")
+            log.info("Unknown command %s in %s (ID: %s) by %s (ID: %s)",
+                     err, fields["guild"], fields["guild_id"],
+                     fields["user"], fields["user_id"], extra={**fields, "presampled": True})
 
     elif isinstance(error, commands.CommandOnCooldown):
         minutes, seconds = divmod(error.retry_after, 60)
@@ -150,9 +407,9 @@ async def on_command_error(ctx: commands.Context, error):
         )
         await ctx.send(embed=embed)
     elif isinstance(error, exceptions.VoiceChError):
-        print(error.description)
+        log.warning(error.description, extra=context_fields(ctx, "command_error"))
     else:
         raise error
 
 if __name__ == "__main__":
-    bot.run(TOKEN)  # Run the bot with the token
+    bot.run(TOKEN, log_handler=None)  # Run the bot with the token, logging is set up above
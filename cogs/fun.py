@@ -1,15 +1,16 @@
 """Stores fun commands of Bot"""
 
-import json
 import random
 import asyncio
-import aiohttp
 
 import discord
 from discord.ext import commands
 
-with open("config.json", encoding="utf-8") as file:
-    config = json.load(file)
+from helpers.cooldowns import persistent_cooldown
+from helpers.exceptions import HTTPRequestError
+from helpers.reactions import add_reactions
+
+DAILYFACT_URL = "https://uselessfacts.jsph.pl/random.json?language=en"
 
 
 class Fun(commands.Cog, name="fun"):
@@ -21,30 +22,28 @@ class Fun(commands.Cog, name="fun"):
     @commands.hybrid_command(name="dailyfact",
                              description="Sends a fact"
                              )
-    @commands.cooldown(1, 86400, commands.BucketType.user)
+    @persistent_cooldown(1, 86400, commands.BucketType.user)
     async def dailyfact(self, ctx):
         """Get a daily fact, command can only be ran once every day per user."""
 
-        # This will prevent your bot from stopping everything when doing a web request
-        async with aiohttp.ClientSession() as session:
-            web_link = "https://uselessfacts.jsph.pl/random.json?language=en"
-            async with session.get(web_link) as request:
-                if request.status == 200:
-                    data = await request.json()
-                    embed = discord.Embed(
-                        description=data["text"],
-                        color=0xD75BF4
-                    )
-                    await ctx.send(embed=embed)
-                else:
-                    embed = discord.Embed(
-                        title="Error!",
-                        description="There is something wrong with the API, please try again later",
-                        color=0xE02B2B
-                    )
-                    await ctx.send(embed=embed)
-                    # We need to reset the cool down since the user didn't got his daily fact.
-                    self.dailyfact.reset_cooldown(ctx)
+        web_link = self.bot.config.get("api", {}).get("dailyfact", DAILYFACT_URL)
+        try:
+            data = await self.bot.http_client.get_json(web_link)
+        except HTTPRequestError:
+            embed = discord.Embed(
+                title="Error!",
+                description="There is something wrong with the API, please try again later",
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            # We need to reset the cool down since the user didn't got his daily fact.
+            self.dailyfact.reset_cooldown(ctx)
+            return
+        embed = discord.Embed(
+            description=data["text"],
+            color=0xD75BF4
+        )
+        await ctx.send(embed=embed)
 
     @commands.hybrid_command(name="rps",
                              description="Play Rock, Paper, Scissors"
@@ -64,8 +63,8 @@ class Fun(commands.Cog, name="fun"):
         embed.set_author(name=ctx.author.display_name,
                          icon_url=ctx.author.display_avatar.url)
         choose_message = await ctx.send(embed=embed)
-        for emoji in reactions:
-            await choose_message.add_reaction(emoji)
+        # Reactions are added in the background, the user may pick before they all show
+        pending_reactions = add_reactions(choose_message, *reactions)
 
         def check(reaction, user):
             return user == ctx.author and str(reaction) in reactions
@@ -84,6 +83,7 @@ class Fun(commands.Cog, name="fun"):
             result_embed = discord.Embed(color=0x42F56C)
             result_embed.set_author(name=ctx.author.display_name,
                                     icon_url=ctx.author.display_avatar.url)
+            await pending_reactions.stop()
             await choose_message.clear_reactions()
 
             if user_choice_index == bot_choice_index:
@@ -103,10 +103,11 @@ class Fun(commands.Cog, name="fun"):
                                             f"\nYou've chosen {user_choice_emote}"
                                             f" and I've chosen {bot_choice_emote}.")
                 result_embed.colour = 0xE02B2B
-                await choose_message.add_reaction("🇱")
+                pending_reactions.add("🇱")
 
             await choose_message.edit(embed=result_embed)
         except asyncio.exceptions.TimeoutError:
+            await pending_reactions.stop()
             await choose_message.clear_reactions()
             timeout_embed = discord.Embed(title="Too late",
                                           color=0xE02B2B
@@ -6,6 +6,8 @@ from platform import python_version
 import discord
 from discord.ext import commands
 
+from helpers.reactions import add_reactions
+
 
 BOT_VERSION = "1.3v"
 
@@ -47,7 +49,7 @@ class General(commands.Cog, name="general"):
         )
         embed.add_field(
             name="Prefix:",
-            value=f"{self.bot.config['bot_prefix']}",
+            value=f"{self.bot.config.prefix}",
             inline=False
         )
         embed.set_footer(text=f"Requested by {ctx.author}")
@@ -151,9 +153,7 @@ class General(commands.Cog, name="general"):
         embed.set_footer(
             text=f"Poll created by: {ctx.author} • React to vote!")
         embed_message = await ctx.send(embed=embed)
-        await embed_message.add_reaction("👍")
-        await embed_message.add_reaction("👎")
-        await embed_message.add_reaction("🤷")
+        add_reactions(embed_message, "👍", "👎", "🤷")
 
     @commands.hybrid_command(name="8ball",
                              descripton="Ask any question to the bot"
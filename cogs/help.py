@@ -3,35 +3,133 @@
 import discord
 from discord.ext import commands
 
+HIDDEN_COGS = {"owner"}
+FIELD_LIMIT = 1024  # Discord's limit for an embed field value
+
+
+def chunk_lines(lines, limit: int = FIELD_LIMIT - 6):
+    """Group lines into blocks that fit a code block field"""
+
+    block, size = [], 0
+    for line in lines:
+        line = line[:limit]
+        if block and size + len(line) + 1 > limit:
+            yield "\n".join(block)
+            block, size = [], 0
+        block.append(line)
+        size += len(line) + 1
+    if block:
+        yield "\n".join(block)
+
 
 class Help(commands.Cog, name="help"):
     """Help Commands"""
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self._cache = {}  # topic -> embed, valid for _cache_key
+        self._cache_key = None
 
-    @commands.hybrid_command(name="help",
-                             description="Get list of all commands"
-                             )
-    async def help(self, ctx):
-        """List all commands from every Cog the bot has loaded."""
+    def visible_cogs(self):
+        """Loaded cogs with commands, in name order"""
+
+        for name, cog in sorted(self.bot.cogs.items()):
+            if name in HIDDEN_COGS:
+                continue
+            bot_commands = [command for command in cog.get_commands() if not command.hidden]
+            if bot_commands:
+                yield name, bot_commands
+
+    def build_overview(self, prefix: str):
+        """Embed listing every command of every cog"""
 
-        prefix = self.bot.config["bot_prefix"]
-        if not isinstance(prefix, str):
-            prefix = prefix[0]
         embed = discord.Embed(
             title="Help", description="List of available commands:",
             color=0x42F56C
         )
-        for i in ["help", "general", "music", "fun", "moderation"]:
-            cog = self.bot.get_cog(i.lower())
-            bot_commands = cog.get_commands()
-            command_list = [command.name for command in bot_commands]
-            command_description = [command.help for command in bot_commands]
-            help_text = "\n".join(
-                        f"{prefix}{n} - {h}" for n, h in zip(command_list, command_description))
-            embed.add_field(name=f"{i.capitalize()}",
+        for name, bot_commands in self.visible_cogs():
+            help_text = "\n".join(f"{prefix}{command.name} - {command.help}"
+                                  for command in bot_commands)
+            if len(help_text) > FIELD_LIMIT - 6:
+                help_text = "\n".join(f"{prefix}{command.name}" for command in bot_commands)
+            if len(help_text) > FIELD_LIMIT - 6:
+                help_text = f"{len(bot_commands)} commands, see {prefix}help {name}"
+            embed.add_field(name=f"{name.capitalize()}",
                             value=f"```{help_text}```", inline=False)
+        embed.set_footer(text=f"{prefix}help <category or command> for details")
+        return embed
+
+    def build_cog(self, prefix: str, name: str, bot_commands):
+        """Embed with every command of one cog"""
+
+        embed = discord.Embed(
+            title=f"Help - {name.capitalize()}",
+            description=self.bot.cogs[name].description,
+            color=0x42F56C
+        )
+        lines = (f"{prefix}{command.name} {command.signature}".rstrip()
+                 + f" - {command.help}" for command in bot_commands)
+        for block in chunk_lines(lines):
+            embed.add_field(name="Commands", value=f"```{block}```", inline=False)
+        return embed
+
+    def build_command(self, prefix: str, command: commands.Command):
+        """Embed with the usage of one command"""
+
+        embed = discord.Embed(
+            title=f"Help - {command.qualified_name}",
+            description=command.help,
+            color=0x42F56C
+        )
+        embed.add_field(
+            name="Usage",
+            value=f"```{prefix}{command.qualified_name} {command.signature}```",
+            inline=False
+        )
+        if command.aliases:
+            embed.add_field(name="Aliases", value=", ".join(command.aliases), inline=False)
+        if isinstance(command, commands.Group):
+            lines = (f"{prefix}{sub.qualified_name} - {sub.help}" for sub in command.commands)
+            for block in chunk_lines(lines):
+                embed.add_field(name="Subcommands", value=f"```{block}```", inline=False)
+        return embed
+
+    def build_all(self, prefix: str):
+        """Render every help page"""
+
+        pages = {None: self.build_overview(prefix)}
+        for name, bot_commands in self.visible_cogs():
+            pages[name] = self.build_cog(prefix, name, bot_commands)
+            for command in bot_commands:
+                page = self.build_command(prefix, command)
+                pages[command.name] = page
+                for alias in command.aliases:
+                    pages[alias] = page
+        return pages
+
+    def get_page(self, topic: str = None):
+        """Cached help page, rebuilt when a cog is added or removed or the prefix changes"""
+
+        prefix = self.bot.config.prefix
+        key = (self.bot.cog_registry_version, prefix)
+        if key != self._cache_key:
+            self._cache = self.build_all(prefix)
+            self._cache_key = key
+        return self._cache.get(topic.lower() if topic else None)
+
+    @commands.hybrid_command(name="help",
+                             description="Get list of all commands"
+                             )
+    async def help(self, ctx, *, topic: str = None):
+        """List all commands from every Cog the bot has loaded."""
+
+        embed = self.get_page(topic)
+        if embed is None:
+            embed = discord.Embed(
+                title="Error!",
+                description=f"There is no category or command called `{topic}`.",
+                color=0xE02B2B
+            )
         await ctx.send(embed=embed)
 
 
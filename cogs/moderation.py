@@ -3,12 +3,29 @@
 import discord
 from discord.ext import commands
 
+from helpers.purge import BACKGROUND_THRESHOLD, PurgeFilter, PurgeJob
+
+
+class PurgeFlags(commands.FlagConverter):
+    """Filters of the purge command"""
+
+    user: discord.User = commands.flag(default=None, description="Only delete messages of this user")
+    bots: bool = commands.flag(default=False, description="Only delete messages of bots")
+    contains: str = commands.flag(default=None, description="Only delete messages containing this")
+    before: int = commands.flag(default=None, description="Only delete messages before this ID")
+    after: int = commands.flag(default=None, description="Only delete messages after this ID")
+
 
 class Moderation(commands.Cog, name="moderation"):
     """Moderation Commands"""
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.purge_jobs = {}  # channel id -> running PurgeJob
+
+    async def cog_unload(self):
+        for job in self.purge_jobs.values():
+            job.cancel()
 
     @commands.hybrid_command(name="say",
                              aliases=["echo"],
@@ -171,8 +188,8 @@ class Moderation(commands.Cog, name="moderation"):
                              )
     @commands.guild_only()
     @commands.has_permissions(manage_messages=True, manage_channels=True)
-    async def purge(self, ctx, amount):
-        """Delete a number of messages."""
+    async def purge(self, ctx, amount, *, flags: PurgeFlags):
+        """Delete a number of messages, optionally filtered by user, bots, content or ID range."""
 
         try:
             amount = int(amount)
@@ -192,14 +209,85 @@ class Moderation(commands.Cog, name="moderation"):
             )
             await ctx.send(embed=embed)
             return
-        purged_messages = await ctx.channel.purge(limit=amount)
-        embed = discord.Embed(
+        if ctx.channel.id in self.purge_jobs:
+            embed = discord.Embed(
+                title="Error!",
+                description=(f"A purge is already running in this channel, "
+                             f"use `{self.bot.config.prefix}purgecancel` to stop it."),
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+
+        check = PurgeFilter(author=flags.user, bots=flags.bots, contains=flags.contains)
+        background = amount >= BACKGROUND_THRESHOLD
+        status = await ctx.send(embed=self.purge_embed(ctx, None, amount, check, background))
+        # Everything older than the progress message, which keeps it out of the purge
+        before = discord.Object(flags.before) if flags.before else status
+        after = discord.Object(flags.after) if flags.after else None
+
+        async def progress(job):
+            await status.edit(embed=self.purge_embed(ctx, job, amount, check, background))
+
+        job = PurgeJob(ctx.channel, amount, check, before=before, after=after, progress=progress)
+        self.purge_jobs[ctx.channel.id] = job
+        task = job.start()
+        task.add_done_callback(lambda _: self.purge_jobs.pop(ctx.channel.id, None))
+        if background:
+            return
+        await task
+        if not job.cancelled and job.error is None:
+            await status.delete(delay=5)
+
+    def purge_embed(self, ctx, job, amount: int, check: PurgeFilter, background: bool):
+        """Progress or result of a purge"""
+
+        filters = check.describe()
+        scope = f"{amount} messages" + (f" {filters}" if filters else "")
+        if job is None:
+            description = f"Purging up to {scope}..."
+            if background:
+                description += (f"\nThis runs in the background, use "
+                                f"`{self.bot.config.prefix}purgecancel` to stop it.")
+            return discord.Embed(title="Purging...", description=description, color=0xF59E42)
+        stats = (f"Deleted **{job.deleted}** of up to {scope}, "
+                 f"scanned {job.scanned} in {job.elapsed:.0f}s.")
+        if not job.done:
+            return discord.Embed(title="Purging...", description=stats, color=0xF59E42)
+        if job.error is not None:
+            return discord.Embed(title="Error!", description=f"{stats}\nStopped: {job.error.text}",
+                                 color=0xE02B2B)
+        if job.cancelled:
+            return discord.Embed(title="Purge Cancelled!", description=stats, color=0xE02B2B)
+        return discord.Embed(
             title="Chat Cleared!",
-            description=(f"**{ctx.author}** cleared "
-                         f"**{len(purged_messages)}** messages!"),
+            description=f"**{ctx.author}** cleared **{job.deleted}** messages!",
+            color=0x42F56C
+        )
+
+    @commands.hybrid_command(name="purgecancel",
+                             description="Stop the purge running in this channel"
+                             )
+    @commands.guild_only()
+    @commands.has_permissions(manage_messages=True, manage_channels=True)
+    async def purgecancel(self, ctx):
+        """Stop the purge running in this channel."""
+
+        job = self.purge_jobs.get(ctx.channel.id)
+        if job is None:
+            embed = discord.Embed(
+                title="Error!",
+                description="There is no purge running in this channel.",
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+        job.cancel()
+        embed = discord.Embed(
+            description=f"Stopping the purge after {job.deleted} deleted messages.",
             color=0x42F56C
         )
-        await ctx.send(embed=embed, delete_after=5)
+        await ctx.send(embed=embed)
 
 
 async def setup(bot: commands.Bot):
@@ -1,12 +1,46 @@
 """Stores music commands of Bot"""
 
-import itertools
+import asyncio
+import time
+from urllib.parse import parse_qs, urlsplit
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from helpers.exceptions import ExtractionError, VoiceChError
+from helpers.timer_wheel import TimerWheel
+
+# The player machinery (helpers.music_player, extractor, song cache) is imported
+# on first use so loading this extension stays cheap at startup
+
+
+QUEUE_PAGE_SIZE = 10
+IDLE_TICK = 5.0  # Seconds between idle checks, players leave up to this late
+IDLE_BATCH = 50  # Idle players disconnected at once
+
+
+def format_duration(seconds: int):
+    """Format seconds as [h:]mm:ss"""
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
+
+
+def is_playlist(url: str):
+    """Whether play was given a playlist link rather than a song
+
+    A watch link with a list= parameter (Mix and radio links) plays its one song.
+    """
+
+    if not url.startswith(("http://", "https://")):
+        return False
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    return parts.path.rstrip("/").endswith("/playlist") or ("list" in query and "v" not in query)
 
-from helpers.music_player import MusicPlayer, YTDLSource
-from helpers.exceptions import VoiceChError
 
 class Music(commands.Cog, name="music"):
     """Music Commands"""
@@ -14,6 +48,148 @@ class Music(commands.Cog, name="music"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.players = {}
+        self.playlist_tasks = {}  # guild id -> set of playlist resolution tasks
+        self._extractor = None
+        self._song_cache = None
+        self._stream_stats = None
+        self._audio_cache = False  # False until created, None when disabled
+        self._ffmpeg_budget = None
+        # guild id -> when its idle player disconnects, one wheel instead of a timer per player
+        self.idle_timeout = bot.config.get("music", {}).get("idle_timeout", 300)
+        self.idle = TimerWheel(IDLE_TICK, int(self.idle_timeout // IDLE_TICK) + 1)
+        # Take over players and workers when this is a reload of the extension
+        state = bot.handover.get(__name__)
+        if state is not None:
+            self.players = state["players"]
+            self.playlist_tasks = state["playlist_tasks"]
+            self._extractor = state["extractor"]
+            self._song_cache = state["song_cache"]
+            self.idle = state["idle"]
+            self._stream_stats = state["stream_stats"]
+            self._audio_cache = state["audio_cache"]
+            self._ffmpeg_budget = state["ffmpeg_budget"]
+            for player in self.players.values():
+                player._cog = self
+        self.save_cache_task.start()
+        self.idle_task.start()
+        self.ffmpeg_task.start()
+
+    async def cog_unload(self):
+        self.save_cache_task.cancel()
+        self.idle_task.cancel()
+        self.ffmpeg_task.cancel()
+        if self.bot.reloading == __name__:
+            # Keep playback going, the reloaded cog picks these up
+            self.bot.handover[__name__] = {
+                "players": self.players,
+                "playlist_tasks": self.playlist_tasks,
+                "extractor": self._extractor,
+                "song_cache": self._song_cache,
+                "idle": self.idle,
+                "stream_stats": self._stream_stats,
+                "audio_cache": self._audio_cache,
+                "ffmpeg_budget": self._ffmpeg_budget,
+            }
+            return
+        if self._song_cache is not None:
+            await self._song_cache.save()
+        if self._extractor is not None:
+            self._extractor.shutdown()
+        if self._audio_cache:
+            self._audio_cache.shutdown()
+
+    @property
+    def extractor(self):
+        """youtube-dl worker pool, created on first use"""
+
+        if self._extractor is None:
+            from helpers.extractor import Extractor
+            self._extractor = Extractor.from_config(self.bot.config)
+        return self._extractor
+
+    @property
+    def song_cache(self):
+        """Song metadata cache, loaded from disk on first use"""
+
+        if self._song_cache is None:
+            from helpers.song_cache import SongCache
+            self._song_cache = SongCache.from_config(self.bot.config)
+        return self._song_cache
+
+    @property
+    def stream_stats(self):
+        """FFmpeg CPU per stream, None unless music.report_cpu is enabled"""
+
+        if self._stream_stats is None and self.bot.config.get("music", {}).get("report_cpu"):
+            from helpers.music_player import StreamCPUStats
+            self._stream_stats = StreamCPUStats()
+        return self._stream_stats
+
+    @property
+    def audio_cache(self):
+        """On-disk cache of popular songs, None unless music.audio_cache is enabled"""
+
+        if self._audio_cache is False:
+            from helpers.audio_cache import AudioCache
+            self._audio_cache = AudioCache.from_config(self.bot.config, self.ffmpeg_budget)
+        return self._audio_cache
+
+    @property
+    def ffmpeg_budget(self):
+        """Cap on concurrent FFmpeg processes, created on first use"""
+
+        if self._ffmpeg_budget is None:
+            from helpers.ffmpeg_budget import FFmpegBudget
+            self._ffmpeg_budget = FFmpegBudget.from_config(self.bot.config)
+        return self._ffmpeg_budget
+
+    @tasks.loop(seconds=5.0)
+    async def ffmpeg_task(self):
+        """Sample FFmpeg CPU and memory, kill stalled processes and reap exited ones"""
+
+        if self._ffmpeg_budget is not None:
+            self._ffmpeg_budget.check()
+
+    @tasks.loop(minutes=10.0)
+    async def save_cache_task(self):
+        """Snapshot the song cache to disk"""
+
+        if self._song_cache is not None:
+            await self._song_cache.save()
+
+    def mark_idle(self, guild_id: int):
+        """Start the idle countdown of a guild's player"""
+        self.idle.schedule(guild_id, time.monotonic() + self.idle_timeout)
+
+    def mark_busy(self, guild_id: int):
+        """Stop the idle countdown of a guild's player"""
+        self.idle.cancel(guild_id)
+
+    @tasks.loop(seconds=IDLE_TICK)
+    async def idle_task(self):
+        """Disconnect players that had nothing to play for idle_timeout seconds"""
+
+        idle_players = []
+        for guild_id in self.idle.expire(time.monotonic()):
+            player = self.players.get(guild_id)
+            if player is not None and not player.busy and player.queue.empty():
+                idle_players.append(player)
+        for start in range(0, len(idle_players), IDLE_BATCH):
+            await asyncio.gather(*(self.disconnect_idle(player)
+                                   for player in idle_players[start:start + IDLE_BATCH]),
+                                 return_exceptions=True)
+
+    async def disconnect_idle(self, player):
+        """Tell the channel and clean up an idle player"""
+
+        embed = discord.Embed(title="Disconnected",
+                              description="Bot Disconnected due to Emptiness feeling",
+                              color=0xE02B2B)
+        try:
+            await player._channel.send(embed=embed)
+        except discord.HTTPException:
+            pass
+        await self.cleanup(player._guild)
 
     async def cleanup(self, guild: discord.Guild):
         """Cleanup player of guild where bot has stopped playing music"""
@@ -23,10 +199,13 @@ class Music(commands.Cog, name="music"):
         except AttributeError:
             pass
 
-        try:
-            del self.players[guild.id]
-        except KeyError:
-            pass
+        for task in self.playlist_tasks.pop(guild.id, ()):
+            task.cancel()
+
+        self.idle.cancel(guild.id)
+        player = self.players.pop(guild.id, None)
+        if player is not None:
+            player.close()
 
     def get_player(self, ctx):
         """Retrieve the guild player, or generate one."""
@@ -34,6 +213,7 @@ class Music(commands.Cog, name="music"):
         try:
             player = self.players[ctx.guild.id]
         except KeyError:
+            from helpers.music_player import MusicPlayer
             player = MusicPlayer(ctx)
             self.players[ctx.guild.id] = player
 
@@ -61,16 +241,69 @@ class Music(commands.Cog, name="music"):
     async def play(self, ctx, *, url: str):
         """Play Music"""
 
+        from helpers.music_player import YTDLSource
+
         try:
             await self.join(ctx)
             player = self.get_player(ctx)
 
-            source = await YTDLSource.create_source(ctx, url, loop=self.bot.loop)
+            if is_playlist(url):
+                await self.enqueue_playlist(ctx, player, url)
+                return
+
+            source = await YTDLSource.create_source(ctx, url, extractor=self.extractor,
+                                                    cache=self.song_cache)
 
-            await player.queue.put(source)
+            player.queue.put_nowait(source)
+            player.wake()
+            player.prefetch()
 
         except VoiceChError:
             return
+        except ExtractionError as e:
+            embed = discord.Embed(title="Error!",
+                                  description=e.description,
+                                  color=0xE02B2B)
+            await ctx.send(embed=embed)
+
+    async def enqueue_playlist(self, ctx, player, url: str):
+        """Queue placeholders for every playlist entry and resolve them in the background"""
+
+        from helpers.music_player import YTDLSource
+
+        title, songs = await YTDLSource.create_playlist(url, ctx.author, extractor=self.extractor)
+        if not songs:
+            embed = discord.Embed(title="Error!",
+                                  description="That playlist is empty.",
+                                  color=0xE02B2B)
+            await ctx.send(embed=embed)
+            return
+        for song in songs:
+            player.queue.put_nowait(song)
+        player.wake()
+        player.prefetch()
+
+        embed = discord.Embed(title="Added Playlist",
+                              description=f"Added {len(songs)} songs from {title} to the Queue.",
+                              color=0x42F56C)
+        embed.set_footer(text="Looking up songs...")
+        message = await ctx.send(embed=embed)
+
+        task = self.bot.loop.create_task(self._resolve_playlist(player, songs, message))
+        tasks_of_guild = self.playlist_tasks.setdefault(ctx.guild.id, set())
+        tasks_of_guild.add(task)
+        task.add_done_callback(tasks_of_guild.discard)
+
+    async def _resolve_playlist(self, player, songs, message: discord.Message):
+        concurrency = self.bot.config.get("music", {}).get("playlist_concurrency", 4)
+        failed = await player.resolve_all(songs, concurrency)
+        embed = message.embeds[0]
+        embed.set_footer(text=(f"{len(songs) - failed} songs ready"
+                               + (f", {failed} unavailable" if failed else "")))
+        try:
+            await message.edit(embed=embed)
+        except discord.HTTPException:
+            pass
 
     @commands.hybrid_command(name="pause",
                              aliases=["stop"],
@@ -121,35 +354,162 @@ class Music(commands.Cog, name="music"):
         await self.cleanup(ctx.guild)
         await ctx.send(embed=embed)
 
-    @commands.hybrid_command(name="queue",
-                             aliases=["q", "playlist"],
-                             description="Displays Song Queue"
-                             )
-    @commands.guild_only()
-    async def queue_info(self, ctx):
-        """Displays Song Queue"""
+    async def queued_player(self, ctx):
+        """Player of a connected guild with songs queued, or None after telling the user"""
 
         vc_client = ctx.voice_client
 
         if not vc_client or not vc_client.is_connected():
-            return await ctx.send("I am not currently connected to voice!")
+            await ctx.send("I am not currently connected to voice!")
+            return None
 
         player = self.get_player(ctx)
         if player.queue.empty():
             embed = discord.Embed(title="Empty Queue",
                                   description="There are currently no more queued songs.",
                                   color=0xFF8C00)
-            return await ctx.send(embed=embed)
+            await ctx.send(embed=embed)
+            return None
+        return player
+
+    @staticmethod
+    def check_position(player, position: int):
+        """Whether a 1-based queue position exists"""
+        return 1 <= position <= len(player.queue)
+
+    @commands.hybrid_command(name="queue",
+                             aliases=["q", "playlist"],
+                             description="Displays Song Queue"
+                             )
+    @commands.guild_only()
+    async def queue_info(self, ctx, page: int = 1):
+        """Displays Song Queue"""
+
+        player = await self.queued_player(ctx)
+        if player is None:
+            return
 
-        # Grab up to 5 entries from the queue...
-        upcoming = list(itertools.islice(player.queue._queue, 0, 5))
+        pages = player.queue.page_count(QUEUE_PAGE_SIZE)
+        page = min(max(page, 1), pages)
+        upcoming = player.queue.page(page, QUEUE_PAGE_SIZE)
 
-        fmt = "\n".join(f'**`{_["title"]}`**' for _ in upcoming)
+        fmt = "\n".join(f'`{i + 1}.` **`{song["title"]}`**' for i, song in upcoming)
         embed = discord.Embed(
-            title=f"Upcoming - Next {len(upcoming)}", description=fmt, color=0xFF8C00)
+            title=f"Upcoming - {len(player.queue)} songs", description=fmt, color=0xFF8C00)
+        embed.set_footer(text=f"Page {page}/{pages} • "
+                              f"Total length {format_duration(player.queue.total_duration)}")
 
         await ctx.send(embed=embed)
 
+    @commands.hybrid_command(name="skip",
+                             aliases=["next"],
+                             description="Skip the current song"
+                             )
+    @commands.guild_only()
+    async def skip(self, ctx):
+        """Skip the current song"""
+
+        vc_client = ctx.voice_client
+
+        if not vc_client or not (vc_client.is_playing() or vc_client.is_paused()):
+            return await ctx.send("I am not currently playing anything!")
+
+        vc_client.stop()
+        embed = discord.Embed(description="Song skipped",
+                              colour=0xF59E42)
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="skipto",
+                             description="Skip to a position in the Queue"
+                             )
+    @commands.guild_only()
+    async def skip_to(self, ctx, position: int):
+        """Skip to a position in the Queue"""
+
+        player = await self.queued_player(ctx)
+        if player is None:
+            return
+        if not self.check_position(player, position):
+            return await ctx.send(f"There is no song at position {position}!")
+
+        player.queue.skip_to(position - 1)
+        if ctx.voice_client.is_playing() or ctx.voice_client.is_paused():
+            ctx.voice_client.stop()
+        embed = discord.Embed(description=f"Skipped to **`{player.queue[0].title}`**",
+                              colour=0xF59E42)
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="remove",
+                             description="Remove a song from the Queue"
+                             )
+    @commands.guild_only()
+    async def remove(self, ctx, position: int):
+        """Remove a song from the Queue"""
+
+        player = await self.queued_player(ctx)
+        if player is None:
+            return
+        if not self.check_position(player, position):
+            return await ctx.send(f"There is no song at position {position}!")
+
+        song = player.queue.remove(position - 1)
+        embed = discord.Embed(description=f"Removed **`{song.title}`** from the Queue",
+                              colour=0xF59E42)
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="move",
+                             description="Move a song to another position in the Queue"
+                             )
+    @commands.guild_only()
+    async def move(self, ctx, position: int, new_position: int):
+        """Move a song to another position in the Queue"""
+
+        player = await self.queued_player(ctx)
+        if player is None:
+            return
+        if not self.check_position(player, position) \
+                or not self.check_position(player, new_position):
+            return await ctx.send("Both positions have to be in the Queue!")
+
+        song = player.queue.move(position - 1, new_position - 1)
+        player.prefetch()
+        embed = discord.Embed(description=f"Moved **`{song.title}`** to position {new_position}",
+                              colour=0xF59E42)
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="shuffle",
+                             description="Shuffle the Queue"
+                             )
+    @commands.guild_only()
+    async def shuffle(self, ctx):
+        """Shuffle the Queue"""
+
+        player = await self.queued_player(ctx)
+        if player is None:
+            return
+
+        player.queue.shuffle()
+        player.prefetch()
+        embed = discord.Embed(description="Queue shuffled",
+                              colour=0xF59E42)
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="dedupe",
+                             description="Remove duplicate songs from the Queue"
+                             )
+    @commands.guild_only()
+    async def dedupe(self, ctx):
+        """Remove duplicate songs from the Queue"""
+
+        player = await self.queued_player(ctx)
+        if player is None:
+            return
+
+        removed = player.queue.dedupe(lambda song: song.video_id or song.webpage_url)
+        embed = discord.Embed(description=f"Removed {removed} duplicate songs",
+                              colour=0xF59E42)
+        await ctx.send(embed=embed)
+
     @commands.hybrid_command(name="playing",
                              aliases=["np", "current", "now_playing"],
                              description="Shows current playing song"
@@ -167,11 +527,12 @@ class Music(commands.Cog, name="music"):
         if not player.current:
             return await ctx.send("I am not currently playing anything!")
 
-        try:
-            # Remove our previous now_playing message.
-            await player.now_playing_msg.delete()
-        except discord.HTTPException:
-            pass
+        if player.now_playing_msg is not None:
+            try:
+                # Remove our previous now_playing message.
+                await player.now_playing_msg.delete()
+            except discord.HTTPException:
+                pass
 
         player.now_playing_msg = await ctx.send(f"**Now Playing:** `{player.current.title}` "
                                                 f"requested by `{player.current.requester}`"
@@ -1,11 +1,14 @@
 """Stores owner commands of Bot"""
 
-import json
+import asyncio
+import time
 
 import discord
 from discord.ext import commands
 
 from helpers import json_manager, checks
+from helpers.exceptions import ConfigError
+from helpers.ipc import HEALTH_INTERVAL
 
 
 class Owner(commands.Cog, name="owner"):
@@ -24,19 +27,349 @@ class Owner(commands.Cog, name="owner"):
             color=0x42F56C
         )
         await ctx.send(embed=embed)
+        await self.bot.broadcast("shutdown")
         await self.bot.close()
 
+    async def manage_extension(self, ctx, action: str, extension: str):
+        """Load, unload or reload an extension and report how long it took"""
+
+        name = extension if extension.startswith("cogs.") else f"cogs.{extension}"
+        method = {
+            "load": self.bot.load_extension,
+            "unload": self.bot.unload_extension,
+            "reload": self.bot.reload_extension,
+        }[action]
+        start = time.perf_counter()
+        try:
+            await method(name)
+        except commands.ExtensionError as e:
+            cause = f"\n`{type(e.__cause__).__name__}: {e.__cause__}`" if e.__cause__ else ""
+            embed = discord.Embed(
+                title="Error!",
+                description=(f"Could not {action} `{name}`: {e}{cause}"
+                             + ("\nThe previous version is still loaded." if action == "reload"
+                                else "")),
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+        embed = discord.Embed(
+            description=f"{action.capitalize()}ed `{name}` in "
+                        f"{(time.perf_counter() - start) * 1000:.0f}ms.",
+            color=0x42F56C
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command(name="load")
+    @checks.is_owner()
+    async def load(self, ctx, extension: str):
+        """Load an extension"""
+
+        await self.manage_extension(ctx, "load", extension)
+
+    @commands.command(name="unload")
+    @checks.is_owner()
+    async def unload(self, ctx, extension: str):
+        """Unload an extension"""
+
+        if extension in ("owner", "cogs.owner"):
+            embed = discord.Embed(
+                title="Error!",
+                description="The owner extension can only be reloaded.",
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+        await self.manage_extension(ctx, "unload", extension)
+
+    @commands.command(name="reload")
+    @checks.is_owner()
+    async def reload(self, ctx, extension: str):
+        """Reload an extension, rolling back to the previous version on failure"""
+
+        await self.manage_extension(ctx, "reload", extension)
+
+    @commands.command(name="reloadconfig", aliases=["rc"])
+    @checks.is_owner()
+    async def reload_config(self, ctx):
+        """Reload config.json without restarting the bot"""
+
+        try:
+            await self.bot.config.reload()
+        except (OSError, ValueError) as e:
+            embed = discord.Embed(
+                title="Error!",
+                description=f"config.json was not reloaded.\n`{type(e).__name__}: {e}`",
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+        embed = discord.Embed(
+            description="Config reloaded.",
+            color=0x42F56C
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command(name="clusters")
+    @checks.is_owner()
+    async def clusters(self, ctx):
+        """Show the health of every cluster"""
+
+        if self.bot.ipc is None:
+            embed = discord.Embed(
+                title="Error!",
+                description="The bot is not running under launcher.py.",
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+        try:
+            health = await self.bot.ipc.request("health")
+        except (asyncio.TimeoutError, ConnectionError):
+            embed = discord.Embed(
+                title="Error!",
+                description="The launcher did not answer, cluster health is unavailable.",
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+        embed = discord.Embed(
+            title=f"{len(health['clusters'])} clusters, {health['shards']} shards, "
+                  f"{health['guilds']} guilds",
+            color=0x0000FF
+        )
+        for cluster_id, report in health["clusters"].items():
+            state = "ready" if report.get("ready") else "starting"
+            if not report["connected"]:
+                state = "disconnected"
+            elif report["age"] > 3 * HEALTH_INTERVAL:
+                # Connected but silent, e.g. its event loop is stuck
+                state = "unreachable"
+            embed.add_field(
+                name=f"Cluster {cluster_id} ({state})",
+                value=(f"Shards {report.get('shards')}\n"
+                       f"{report.get('guilds', 0)} guilds, "
+                       f"{report.get('latency', 0) * 1000:.0f}ms\n"
+                       f"{report.get('music_players', 0)} players, "
+                       f"{report.get('commands', 0)} commands\n"
+                       f"Reported {report['age']:.0f}s ago"),
+            )
+        await ctx.send(embed=embed)
+
+    @commands.command(name="startup")
+    @checks.is_owner()
+    async def startup(self, ctx):
+        """Show where startup time went"""
+
+        report = self.bot.startup
+        embed = discord.Embed(
+            title="Startup",
+            description=(f"Extensions loaded after {report.setup_at or 0:.2f}s, "
+                         f"ready after {report.ready_at or 0:.2f}s"),
+            color=0x0000FF
+        )
+        embed.add_field(
+            name="Extensions (import / setup)",
+            value="\n".join(f"`{name}` {times.get('import', 0) * 1000:.0f}ms / "
+                            f"{times.get('setup', 0) * 1000:.0f}ms"
+                            for name, times in sorted(report.extensions.items())) or "None",
+            inline=False
+        )
+        if report.failed:
+            embed.add_field(
+                name="Failed",
+                value="\n".join(f"`{name}` {error}" for name, error in report.failed.items()),
+                inline=False
+            )
+        embed.add_field(
+            name="Slowest imports",
+            value="\n".join(f"`{module}` {seconds * 1000:.0f}ms"
+                            for module, seconds in report.slowest_imports()) or "None",
+            inline=False
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command(name="metrics")
+    @checks.is_owner()
+    async def metrics(self, ctx):
+        """Summarize command latency, errors and gauges"""
+
+        metrics = self.bot.metrics
+        latency = metrics.command_latency
+        busiest = sorted(latency.series, key=lambda labels: latency.count(*labels),
+                         reverse=True)[:10]
+        embed = discord.Embed(
+            title="Metrics",
+            color=0x0000FF
+        )
+        embed.add_field(
+            name="Commands (count, p50, p99)",
+            value="\n".join(f"`{labels[0]}` {latency.count(*labels)}, "
+                            f"≤{latency.quantile(0.5, *labels)}s, "
+                            f"≤{latency.quantile(0.99, *labels)}s"
+                            for labels in busiest) or "None yet",
+            inline=False
+        )
+        errors = sorted(metrics.command_errors.values.items(),
+                        key=lambda item: item[1], reverse=True)[:10]
+        embed.add_field(
+            name="Errors",
+            value="\n".join(f"`{command}` {error}: {count}"
+                            for (command, error), count in errors) or "None",
+            inline=False
+        )
+        embed.add_field(
+            name="Gauges",
+            value="\n".join(f"`{gauge.name}` {gauge.func():g}"
+                            for gauge in metrics.registry if gauge.kind == "gauge"),
+            inline=False
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command(name="lag")
+    @checks.is_owner()
+    async def lag(self, ctx, action: str = None):
+        """Show where the event loop got blocked, `lag reset` forgets it"""
+
+        monitor = self.bot.lag_monitor
+        if monitor is None:
+            embed = discord.Embed(
+                title="Error!",
+                description="The lag monitor is disabled in config.json.",
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+        if action == "reset":
+            monitor.reset()
+            embed = discord.Embed(
+                description="Forgot all recorded event loop stalls.",
+                color=0x42F56C
+            )
+            await ctx.send(embed=embed)
+            return
+        embed = discord.Embed(
+            title="Event Loop Lag",
+            description=(f"Last {monitor.last_lag * 1000:.1f}ms, "
+                         f"worst {monitor.max_lag * 1000:.0f}ms, "
+                         f"{monitor.stalls} stalls over {monitor.threshold * 1000:.0f}ms"),
+            color=0x0000FF
+        )
+        sites = monitor.top()
+        for site in sites:
+            embed.add_field(
+                name=site.where[-256:],
+                value=(f"{site.count} stalls, worst {site.worst * 1000:.0f}ms, "
+                       f"avg {site.total / site.count * 1000:.0f}ms"),
+                inline=False
+            )
+        if sites:
+            # Embed fields cap at 1024 characters, the innermost frames matter most
+            embed.add_field(
+                name="Worst Stack",
+                value=f"```{sites[0].stack[-1000:]}```",
+                inline=False
+            )
+        await ctx.send(embed=embed)
+
+    @commands.command(name="musicstats")
+    @checks.is_owner()
+    async def music_stats(self, ctx):
+        """Show youtube-dl queue and extraction times and song cache usage"""
+
+        music = self.bot.get_cog("music")
+        if music is None:
+            embed = discord.Embed(
+                title="Error!",
+                description="The music extension is not loaded.",
+                color=0xE02B2B
+            )
+            await ctx.send(embed=embed)
+            return
+        # Read what is running, the lazy properties would start the pool or load caches
+        embed = discord.Embed(
+            title="Music Stats",
+            color=0x0000FF
+        )
+        if music._extractor is None:
+            embed.add_field(name="Extractions", value="not started", inline=False)
+        else:
+            stats = music._extractor.stats.summary()
+            embed.add_field(
+                name="Extractions",
+                value=(f"{stats['requests']} done, {stats['failures']} failed, "
+                       f"{stats['timeouts']} timed out, {stats['cancelled']} cancelled"),
+                inline=False
+            )
+            embed.add_field(
+                name="Queued",
+                value=f"avg {stats['queued_avg']:.2f}s / max {stats['queued_max']:.2f}s"
+            )
+            embed.add_field(
+                name="Extracting",
+                value=f"avg {stats['extract_avg']:.2f}s / max {stats['extract_max']:.2f}s"
+            )
+        song_cache = music._song_cache
+        if song_cache is None:
+            embed.add_field(name="Song Cache", value="not started", inline=False)
+        else:
+            cache = song_cache.summary()
+            embed.add_field(
+                name="Song Cache",
+                value=(f"{cache['hits']} hits, {cache['misses']} misses "
+                       f"({cache['hit_rate']:.0%}), {cache['stale_streams']} stale streams\n"
+                       f"{cache['songs']}/{song_cache.max_songs} songs, "
+                       f"{cache['searches']}/{song_cache.max_searches} searches, "
+                       f"{cache['evictions']} evicted"),
+                inline=False
+            )
+        if music._ffmpeg_budget is None:
+            embed.add_field(name="FFmpeg", value="not started", inline=False)
+        else:
+            ffmpeg = music._ffmpeg_budget.summary()
+            embed.add_field(
+                name="FFmpeg",
+                value=(f"{ffmpeg['running']}/{ffmpeg['max']} running, "
+                       f"{ffmpeg['waiting']} waiting, {ffmpeg['cpu_percent']:.0f}% CPU, "
+                       f"{ffmpeg['rss'] / 2 ** 20:.0f} MiB\n"
+                       f"{ffmpeg['queued']} had to wait, {ffmpeg['stalled']} stalled, "
+                       f"{ffmpeg['reaped']} reaped"),
+                inline=False
+            )
+        if music._audio_cache is False:
+            if music.bot.config.get("music", {}).get("audio_cache", {}).get("enabled"):
+                embed.add_field(name="Audio Cache", value="not started", inline=False)
+        elif music._audio_cache is not None:
+            audio = music._audio_cache.summary()
+            embed.add_field(
+                name="Audio Cache",
+                value=(f"{audio['hits']} hits, {audio['misses']} misses, "
+                       f"{audio['fills']} stored, {audio['failed']} failed, "
+                       f"{audio['filling']} downloading\n"
+                       f"{audio['songs']} songs, {audio['bytes'] / 2 ** 20:.0f}/"
+                       f"{audio['max_bytes'] / 2 ** 20:.0f} MiB, {audio['evictions']} evicted"),
+                inline=False
+            )
+        if music._stream_stats is not None:
+            cpu = music._stream_stats.summary()
+            embed.add_field(
+                name="FFmpeg CPU",
+                value="\n".join(f"{mode}: {stats['cpu_percent']:.1f}% of a core per stream "
+                                 f"({stats['streams']} streams)" for mode, stats in cpu.items()),
+                inline=False
+            )
+        await ctx.send(embed=embed)
+
     @commands.group(name="blacklist")
     @checks.is_owner()
     async def blacklist(self, ctx):
         """Lets you add or remove a user from not being able to use the bot."""
 
         if ctx.invoked_subcommand is None:
-            with open("blacklist.json", encoding="utf-8") as infile:
-                blacklist = json.load(infile)
+            blacklist = self.bot.blacklist
             embed = discord.Embed(
-                title=f"There are currently {len(blacklist['ids'])} blacklisted IDs",
-                description=f"{', '.join(str(id) for id in blacklist['ids'])}",
+                title=f"There are currently {len(blacklist)} blacklisted IDs",
+                description=f"{', '.join(str(id) for id in blacklist)}",
                 color=0x0000FF
             )
             await ctx.send(embed=embed)
@@ -48,9 +381,7 @@ class Owner(commands.Cog, name="owner"):
 
         user_id = member.id
         try:
-            with open("blacklist.json", encoding="utf-8") as infile:
-                blacklist = json.load(infile)
-            if user_id in blacklist['ids']:
+            if user_id in self.bot.blacklist:
                 embed = discord.Embed(
                     title="Error!",
                     description=f"**{member.name}** is already in the blacklist.",
@@ -58,16 +389,15 @@ class Owner(commands.Cog, name="owner"):
                 )
                 await ctx.send(embed=embed)
                 return
-            json_manager.add_user_to_blacklist(user_id)
+            await json_manager.add_user_to_blacklist(user_id)
+            await self.bot.broadcast("blacklist", {"user_id": user_id, "blacklisted": True})
             embed = discord.Embed(
                 title="User Blacklisted",
                 description=f"**{member.name}** has been successfully added to the blacklist",
                 color=0x42F56C
             )
-            with open("blacklist.json", encoding="utf-8") as infile:
-                blacklist = json.load(infile)
             embed.set_footer(
-                text=f"There are now {len(blacklist['ids'])} users in the blacklist"
+                text=f"There are now {len(self.bot.blacklist)} users in the blacklist"
             )
             await ctx.send(embed=embed)
         except:
@@ -86,17 +416,16 @@ class Owner(commands.Cog, name="owner"):
 
         user_id = member.id
         try:
-            json_manager.remove_user_from_blacklist(user_id)
+            await json_manager.remove_user_from_blacklist(user_id)
+            await self.bot.broadcast("blacklist", {"user_id": user_id, "blacklisted": False})
             embed = discord.Embed(
                 title="User removed from blacklist",
                 description=(f"**{member.name}** has been successfully "
                              "removed from the blacklist"),
                 color=0x42F56C
             )
-            with open("blacklist.json", encoding="utf-8") as infile:
-                blacklist = json.load(infile)
             embed.set_footer(
-                text=f"There are now {len(blacklist['ids'])} users in the blacklist"
+                text=f"There are now {len(self.bot.blacklist)} users in the blacklist"
             )
             await ctx.send(embed=embed)
         except:
@@ -113,12 +442,10 @@ class Owner(commands.Cog, name="owner"):
         """Lets you add or remove a status from a list of statuses"""
 
         if ctx.invoked_subcommand is None:
-
-            with open("config.json", encoding="utf-8") as infile:
-                body = json.load(infile)
+            statuses = self.bot.config.statuses
             embed = discord.Embed(
-                title=f"There are currently {len(body['statuses'])} statuses",
-                description=f"{', '.join(str(id) for id in body['statuses'])}",
+                title=f"There are currently {len(statuses)} statuses",
+                description=f"{', '.join(statuses)}",
                 color=0x0000FF
             )
             await ctx.send(embed=embed)
@@ -129,9 +456,7 @@ class Owner(commands.Cog, name="owner"):
         """Lets you add a status to the list of statuses"""
 
         try:
-            with open("config.json", encoding="utf-8") as infile:
-                body = json.load(infile)
-            if sentence in body['statuses']:
+            if sentence in self.bot.config.statuses:
                 embed = discord.Embed(
                     title="Error!",
                     description=f"**{sentence}** is already in the statuses.",
@@ -139,16 +464,14 @@ class Owner(commands.Cog, name="owner"):
                 )
                 await ctx.send(embed=embed)
                 return
-            json_manager.add_status_to_config(sentence)
+            await json_manager.add_status_to_config(sentence)
             embed = discord.Embed(
                 title="Status Added",
                 description=f"**{sentence}** has been successfully added to the statuses.",
                 color=0x42F56C
             )
-            with open("config.json", encoding="utf-8") as infile:
-                body = json.load(infile)
             embed.set_footer(
-                text=f"There are now {len(body['statuses'])} statuses."
+                text=f"There are now {len(self.bot.config.statuses)} statuses."
             )
             await ctx.send(embed=embed)
         except:
@@ -166,16 +489,21 @@ class Owner(commands.Cog, name="owner"):
         """Lets you remove a status from the list of statuses"""
 
         try:
-            json_manager.remove_status_from_config(sentence)
+            await json_manager.remove_status_from_config(sentence)
             embed = discord.Embed(
                 title="Status removed from statuses",
                 description=f"**{sentence}** has been successfully removed from the statuses.",
                 color=0x42F56C
             )
-            with open("config.json", encoding="utf-8") as infile:
-                body = json.load(infile)
             embed.set_footer(
-                text=f"There are now {len(body['statuses'])} statuses."
+                text=f"There are now {len(self.bot.config.statuses)} statuses."
+            )
+            await ctx.send(embed=embed)
+        except ConfigError:
+            embed = discord.Embed(
+                title="Error!",
+                description="The bot needs at least one status, add another one first.",
+                color=0xE02B2B
             )
             await ctx.send(embed=embed)
         except:
@@ -194,6 +522,7 @@ class Owner(commands.Cog, name="owner"):
         try:
             await ctx.bot.change_presence(status=discord.Status.idle,
                                           activity=discord.Game(sentence))
+            await self.bot.broadcast("status_set", {"status": sentence})
             embed = discord.Embed(
                 title="Status set",
                 description=f"**{sentence}** has been successfully set to bot.",
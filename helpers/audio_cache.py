@@ -0,0 +1,251 @@
+"""Contains the on-disk audio cache for frequently played songs"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from helpers.persistence import atomic_write
+
+log = logging.getLogger("tg9.audio_cache")
+
+INDEX_FILE = "index.json"
+FILL_CONCURRENCY = 2  # FFmpeg downloads running at once
+MAX_TRACKED = 10000  # Songs whose play counts are remembered
+BUDGET_KEY = "audio_cache"  # Fills take turns with the guilds in the FFmpeg budget
+
+
+def file_digest(path: str):
+    """SHA-256 of a file"""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AudioCache:
+    """Opus files of songs played at least min_plays times, LRU evicted by total size
+
+    Files are stored under their content hash, index.json maps video ids to
+    hashes. Songs are stored by an FFmpeg run in the background, which copies
+    Opus streams and transcodes anything else, so a miss never delays playback.
+    That FFmpeg holds a slot of the host's FFmpegBudget like a playing song.
+    """
+
+    def __init__(self, directory: str = "audio_cache", max_bytes: int = 2 << 30,
+                 min_plays: int = 3, budget=None):
+        self.directory = directory
+        self.budget = budget
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.entries = OrderedDict()  # video id -> {"hash": str, "size": int}, LRU order
+        self.refs = {}  # hash -> entries sharing that file
+        self.total_bytes = 0
+        self.plays = OrderedDict()  # video id -> play count, bounded to MAX_TRACKED
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.failed = 0  # Fills that stored nothing
+        self.evictions = 0
+        self._filling = {}  # video id -> fill task
+        self._semaphore = asyncio.Semaphore(FILL_CONCURRENCY)
+
+    @classmethod
+    def from_config(cls, config, budget=None):
+        """Cache from the music.audio_cache section of config.json, None unless enabled"""
+
+        settings = config.get("music", {}).get("audio_cache", {})
+        if not settings.get("enabled"):
+            return None
+        cache = cls(directory=settings.get("directory", "audio_cache"),
+                    max_bytes=settings.get("max_bytes", 2 << 30),
+                    min_plays=settings.get("min_plays", 3), budget=budget)
+        cache.load()
+        return cache
+
+    def _path(self, digest: str):
+        return os.path.join(self.directory, digest[:2], f"{digest}.opus")
+
+    def load(self):
+        """Read the index, dropping entries whose file is gone"""
+
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), encoding="utf-8") as file:
+                entries = json.load(file)
+        except (FileNotFoundError, ValueError):
+            entries = []
+        for video_id, entry in entries:
+            if os.path.exists(self._path(entry["hash"])):
+                self._add(video_id, entry)
+
+    async def save(self):
+        """Write the index off the event loop"""
+
+        payload = json.dumps(list(self.entries.items()))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, atomic_write,
+                                   os.path.join(self.directory, INDEX_FILE), payload)
+
+    def lookup(self, video_id: str):
+        """Path of the cached file of a song, or None"""
+
+        entry = self.entries.get(video_id)
+        if entry is not None:
+            path = self._path(entry["hash"])
+            if os.path.exists(path):
+                self.entries.move_to_end(video_id)
+                self.hits += 1
+                return path
+            # Deleted behind our back
+            self._drop(video_id)
+        self.misses += 1
+        return None
+
+    def played(self, song):
+        """Count a play of a resolved song and store it once it is popular enough"""
+
+        if song.video_id is None or song.video_id in self.entries:
+            return
+        count = self.plays.pop(song.video_id, 0) + 1
+        self.plays[song.video_id] = count
+        if len(self.plays) > MAX_TRACKED:
+            self.plays.popitem(last=False)
+        if count >= self.min_plays and song.video_id not in self._filling and song.url:
+            task = asyncio.get_running_loop().create_task(
+                self._fill(song.video_id, song.url, song.codec))
+            self._filling[song.video_id] = task
+            task.add_done_callback(lambda _: self._filling.pop(song.video_id, None))
+
+    async def _fill(self, video_id: str, url: str, codec: str):
+        async with self._semaphore:
+            lease = None
+            if self.budget is not None:
+                lease = await self.budget.acquire(BUDGET_KEY)
+            try:
+                digest, size = await self._download(video_id, url, codec)
+            except Exception:  # Nobody awaits this task, so the error ends here
+                log.exception("Caching %s failed", video_id)
+                digest = None
+            finally:
+                if lease is not None:
+                    self.budget.release(lease)
+        if digest is None:
+            self.failed += 1
+            return
+        old = self.entries.pop(video_id, None)
+        self._add(video_id, {"hash": digest, "size": size})
+        if old is not None:
+            # After adding, so a file with the same content is not deleted
+            self._release(old)
+        self.plays.pop(video_id, None)
+        self.fills += 1
+        self._evict()
+        try:
+            await self.save()
+        except OSError as e:
+            log.warning("Could not save the audio cache index: %s", e)
+
+    async def _download(self, video_id: str, url: str, codec: str):
+        """Run FFmpeg into a temp file and store it by hash, returns (hash, size) or (None, None)"""
+
+        temp = os.path.join(self.directory, f".fill-{video_id}.opus")
+        args = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5",
+                "-i", url, "-vn", "-map_metadata", "-1"]
+        if codec == "opus":
+            args += ["-c:a", "copy"]
+        else:
+            args += ["-c:a", "libopus", "-b:a", "128k", "-ar", "48000", "-ac", "2"]
+        args += ["-f", "opus", temp]
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            log.warning("Could not start FFmpeg to cache %s: %s", video_id, e)
+            return None, None
+        try:
+            _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            self._remove(temp)
+            raise
+        if process.returncode != 0:
+            log.warning("Caching %s failed: %s", video_id,
+                        stderr.decode(errors="replace").strip()[-200:])
+            self._remove(temp)
+            return None, None
+        loop = asyncio.get_running_loop()
+        try:
+            digest = await loop.run_in_executor(None, file_digest, temp)
+            path = self._path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp, path)  # Same content under the same name, replacing is fine
+            size = os.path.getsize(path)
+        except OSError as e:
+            log.warning("Could not store %s: %s", video_id, e)
+            self._remove(temp)
+            return None, None
+        return digest, size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            video_id = next(iter(self.entries))
+            self._drop(video_id)
+            self.evictions += 1
+
+    def _add(self, video_id: str, entry: dict):
+        # The first reference to a file counts its size
+        self.entries[video_id] = entry
+        count = self.refs.get(entry["hash"], 0)
+        if count == 0:
+            self.total_bytes += entry["size"]
+        self.refs[entry["hash"]] = count + 1
+
+    def _drop(self, video_id: str):
+        entry = self.entries.pop(video_id, None)
+        if entry is not None:
+            self._release(entry)
+
+    def _release(self, entry: dict):
+        count = self.refs.pop(entry["hash"]) - 1
+        if count:
+            # Another song has the same content, the file stays
+            self.refs[entry["hash"]] = count
+            return
+        self.total_bytes -= entry["size"]
+        self._remove(self._path(entry["hash"]))
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self):
+        """Cancel running fills"""
+
+        for task in list(self._filling.values()):
+            task.cancel()
+
+    def summary(self):
+        """Counters for the musicstats command"""
+
+        return {
+            "songs": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fills": self.fills,
+            "failed": self.failed,
+            "filling": len(self._filling),
+            "evictions": self.evictions,
+        }
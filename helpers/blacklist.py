@@ -0,0 +1,76 @@
+"""Contains in-memory Blacklist index"""
+
+from helpers.persistence import get_document
+
+
+def validate(data):
+    """Check the shape of blacklist.json, raises ValueError"""
+
+    if not isinstance(data, dict) or not isinstance(data.get("ids"), list):
+        raise ValueError("blacklist.json must contain an object with an `ids` list")
+    if not all(isinstance(i, int) for i in data["ids"]):
+        raise ValueError("`ids` must be a list of user IDs")
+
+
+class Blacklist:
+    """Set of blacklisted user IDs kept in memory and written behind to disk"""
+
+    def __init__(self, path: str = "blacklist.json"):
+        self.document = get_document(path)
+        # A malformed edit is rejected before it replaces the loaded data
+        self.document.validator = validate
+        validate(self.document.data)
+        self.ids = set(self.document.data["ids"])
+
+    def __contains__(self, user_id: int):
+        return user_id in self.ids
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    async def refresh(self):
+        """Reload the blacklist if the file was edited outside the bot"""
+
+        if not await self.document.refresh():
+            return False
+        self.ids = set(self.document.data["ids"])
+        return True
+
+    async def add(self, user_id: int):
+        """Add User to Blacklist"""
+
+        def apply(data):
+            if user_id not in self.ids:
+                data["ids"].append(user_id)
+                self.ids.add(user_id)
+
+        await self.document.mutate(apply)
+
+    async def remove(self, user_id: int):
+        """Remove User from Blacklist, raises ValueError if not present"""
+
+        def apply(data):
+            if user_id not in self.ids:
+                raise ValueError(f"{user_id} is not in the blacklist")
+            data["ids"].remove(user_id)
+            self.ids.remove(user_id)
+
+        await self.document.mutate(apply)
+
+    def sync(self, user_id: int, blacklisted: bool):
+        """Apply a change another cluster made, that cluster writes the file"""
+
+        # Also in the document, or our next write would drop the other cluster's change
+        ids = self.document.data["ids"]
+        if blacklisted and user_id not in self.ids:
+            self.ids.add(user_id)
+            ids.append(user_id)
+        elif not blacklisted and user_id in self.ids:
+            self.ids.discard(user_id)
+            ids.remove(user_id)
+
+
+blacklist = Blacklist()
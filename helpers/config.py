@@ -0,0 +1,84 @@
+"""Contains the Bot configuration"""
+
+from helpers.exceptions import ConfigError
+from helpers.persistence import get_document
+
+
+def validate(data):
+    """Check the shape of config.json, raises ConfigError"""
+
+    if not isinstance(data, dict):
+        raise ConfigError("config.json must contain an object")
+    prefix = data.get("bot_prefix")
+    if isinstance(prefix, str):
+        prefix = [prefix]
+    if not prefix or not all(isinstance(i, str) and i for i in prefix):
+        raise ConfigError("`bot_prefix` must be a string or a list of strings")
+    owners = data.get("owners")
+    if not isinstance(owners, list) or not all(isinstance(i, int) for i in owners):
+        raise ConfigError("`owners` must be a list of user IDs")
+    statuses = data.get("statuses")
+    if not isinstance(statuses, list) or not statuses \
+            or not all(isinstance(i, str) for i in statuses):
+        raise ConfigError("`statuses` must be a non-empty list of strings")
+
+
+class Config:
+    """Validated, in-memory view of config.json"""
+
+    def __init__(self, path: str = "config.json"):
+        self.document = get_document(path)
+        self.document.validator = validate
+        validate(self.document.data)
+        self._version = None
+        self._sync()
+
+    def __getitem__(self, key: str):
+        return self.document.data[key]
+
+    def get(self, key: str, default=None):
+        """Raw access to a config.json key"""
+        return self.document.data.get(key, default)
+
+    def _sync(self):
+        # Rebuild the derived values only when the document changed
+        document = self.document
+        if document.version == self._version:
+            return
+        data = document.data
+        prefix = data["bot_prefix"]
+        self._prefixes = (prefix,) if isinstance(prefix, str) else tuple(prefix)
+        self._owners = frozenset(data["owners"])
+        self._statuses = tuple(data["statuses"])
+        self._version = document.version
+
+    @property
+    def prefixes(self):
+        """Tuple of command prefixes"""
+        self._sync()
+        return self._prefixes
+
+    @property
+    def prefix(self):
+        """Main command prefix"""
+        return self.prefixes[0]
+
+    @property
+    def owners(self):
+        """Frozenset of owner IDs"""
+        self._sync()
+        return self._owners
+
+    @property
+    def statuses(self):
+        """Tuple of game statuses"""
+        self._sync()
+        return self._statuses
+
+    async def refresh(self):
+        """Reload config.json if it was edited outside the bot, returns True on reload"""
+        return await self.document.refresh()
+
+    async def reload(self):
+        """Reload config.json now, the old values are kept if it is invalid"""
+        await self.document.reload()
@@ -0,0 +1,268 @@
+"""Contains command cooldowns that survive restarts"""
+
+import asyncio
+import json
+import logging
+import time
+
+from discord.ext import commands
+
+from helpers.persistence import locked_update
+from helpers.timer_wheel import TimerWheel
+
+log = logging.getLogger("tg9.cooldowns")
+
+COOLDOWNS_FILE = "cooldowns.json"
+WHEEL_TICK = 60.0  # Seconds per timer wheel slot
+WHEEL_SLOTS = 1440  # One day per revolution at the default tick
+
+
+class StoredCooldown:
+    """One bucket of a PersistentCooldownMapping, a view over its compact state"""
+
+    __slots__ = ("mapping", "key")
+
+    def __init__(self, mapping, key):
+        self.mapping = mapping
+        self.key = key
+
+    @property
+    def rate(self):
+        return self.mapping._cooldown.rate
+
+    @property
+    def per(self):
+        return self.mapping._cooldown.per
+
+    def get_tokens(self, current: float = None):
+        """Uses left in the current window"""
+
+        current = current or time.time()
+        return self.rate - self.mapping._used(self.key, current)
+
+    def get_retry_after(self, current: float = None):
+        """Seconds until the bucket has a use again, 0 if it has one"""
+
+        current = current or time.time()
+        if self.get_tokens(current):
+            return 0.0
+        return self.mapping.windows[self.key] + self.per - current
+
+    def update_rate_limit(self, current: float = None, *, tokens: int = 1):
+        """Use the bucket, returns the retry after if it is exhausted"""
+
+        return self.mapping._use(self.key, current or time.time(), tokens)
+
+    def reset(self):
+        """Forget every use"""
+        self.mapping._forget(self.key)
+
+    def copy(self):
+        return StoredCooldown(self.mapping, self.key)
+
+    def __repr__(self):
+        return f"<StoredCooldown key={self.key!r} rate={self.rate} per={self.per}>"
+
+
+class PersistentCooldownMapping(commands.CooldownMapping):
+    """Cooldown mapping keeping only a window start per active key
+
+    Buckets are not Cooldown objects but views created on access; the state is
+    a window start per key, plus a use count for rates above one. Keys are
+    dropped by a timer wheel once their window is over, so memory follows the
+    number of keys on cooldown, and the state is snapshot to disk by the store.
+    """
+
+    def __init__(self, original: commands.Cooldown, type, name: str = None):
+        super().__init__(original, type)
+        self.name = name
+        self.windows = {}  # bucket key -> start of the window
+        self.uses = {}  # bucket key -> uses in the window, only for rates above one
+        self.wheel = TimerWheel(WHEEL_TICK, WHEEL_SLOTS)
+        self.forgotten = {}  # bucket key -> when it was reset, until the next save
+        self.dirty = False
+
+    def copy(self):
+        # Commands are copied per cog instance, they must keep sharing the state
+        return self
+
+    def __len__(self):
+        return len(self.windows)
+
+    def _bucket_key(self, msg):
+        key = self._type(msg)
+        return tuple(key) if isinstance(key, list) else key
+
+    def _verify_cache_integrity(self, current: float = None):
+        for key in self.wheel.expire(current or time.time()):
+            self.windows.pop(key, None)
+            self.uses.pop(key, None)
+            self.dirty = True
+
+    def _used(self, key, current: float):
+        window = self.windows.get(key)
+        if window is None or current > window + self._cooldown.per:
+            return 0
+        return self.uses.get(key, 1)
+
+    def _use(self, key, current: float, tokens: int):
+        cooldown = self._cooldown
+        used = self._used(key, current)
+        if used == 0:
+            self.windows[key] = current
+            self.wheel.schedule(key, current + cooldown.per)
+        if used + tokens > cooldown.rate:
+            return self.windows[key] + cooldown.per - current
+        used += tokens
+        if cooldown.rate > 1:
+            self.uses[key] = used
+        self.dirty = True
+        return None
+
+    def _forget(self, key):
+        self.forgotten[key] = time.time()
+        self.windows.pop(key, None)
+        self.uses.pop(key, None)
+        self.wheel.cancel(key)
+        self.dirty = True
+
+    def get_bucket(self, message, current: float = None):
+        self._verify_cache_integrity(current)
+        return StoredCooldown(self, self._bucket_key(message))
+
+    def update_rate_limit(self, message, current: float = None, tokens: int = 1):
+        return self.get_bucket(message, current).update_rate_limit(current, tokens=tokens)
+
+    def dump(self):
+        """Active buckets as JSON-friendly [key, window, uses] rows"""
+
+        now = time.time()
+        self._verify_cache_integrity(now)
+        return [[list(key) if isinstance(key, tuple) else key, window, self.uses.get(key, 1)]
+                for key, window in self.windows.items()
+                if now <= window + self._cooldown.per]
+
+    def restore(self, rows):
+        """Load rows written by dump, skipping windows that are over"""
+
+        now = time.time()
+        for key, window, uses in rows:
+            if now > window + self._cooldown.per:
+                continue
+            key = tuple(key) if isinstance(key, list) else key
+            self.windows[key] = window
+            if self._cooldown.rate > 1:
+                self.uses[key] = uses
+            self.wheel.schedule(key, window + self._cooldown.per)
+
+
+def merge_rows(stored, rows, per: float, now: float, forgotten=None):
+    """Union of two dumps of one mapping, the later window of a key wins
+
+    Stored windows which started before we reset their key are dropped.
+    """
+
+    forgotten = forgotten or {}
+    merged = {}
+    for ours, source in ((False, stored), (True, rows)):
+        for row in source:
+            key, window, uses = row
+            if now > window + per:
+                continue
+            hashable = tuple(key) if isinstance(key, list) else key
+            if not ours and window <= forgotten.get(hashable, 0.0):
+                continue
+            current = merged.get(hashable)
+            if current is None or (window, uses) > (current[1], current[2]):
+                merged[hashable] = row
+    return list(merged.values())
+
+
+class CooldownStore:
+    """Every persistent cooldown mapping, snapshot together to one file
+
+    Clusters share the file: save() merges with what is on disk under a file
+    lock, so one cluster never drops the cooldowns another one wrote.
+    """
+
+    def __init__(self, path: str = COOLDOWNS_FILE):
+        self.path = path
+        self.mappings = {}  # name -> PersistentCooldownMapping
+        self.snapshot = {}  # name -> rows read at startup, consumed on registration
+        self._write_lock = asyncio.Lock()
+        self.load()
+
+    def load(self):
+        """Read the last snapshot, a missing or broken file starts empty"""
+
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                self.snapshot = json.load(file)
+        except FileNotFoundError:
+            self.snapshot = {}
+        except ValueError:
+            log.warning("Ignoring unreadable cooldown snapshot %s", self.path)
+            self.snapshot = {}
+
+    def mapping(self, name: str, rate: int, per: float, type):
+        """Mapping for a command, restored from the snapshot or shared if it exists"""
+
+        mapping = self.mappings.get(name)
+        if mapping is None:
+            mapping = PersistentCooldownMapping(commands.Cooldown(rate, per), type, name)
+            mapping.restore(self.snapshot.pop(name, ()))
+            self.mappings[name] = mapping
+        return mapping
+
+    async def save(self):
+        """Write every mapping with changes off the event loop"""
+
+        async with self._write_lock:
+            if not any(mapping.dirty for mapping in self.mappings.values()):
+                return
+            ours = {}
+            for name, mapping in self.mappings.items():
+                ours[name] = (mapping.dump(), mapping._cooldown.per, mapping.forgotten)
+                mapping.forgotten = {}
+                mapping.dirty = False
+            now = time.time()
+
+            def merge(data):
+                # Other clusters' rows and mappings of commands not loaded here are kept
+                data = data if isinstance(data, dict) else {}
+                for name, (rows, per, forgotten) in ours.items():
+                    data[name] = merge_rows(data.get(name, ()), rows, per, now, forgotten)
+                return json.dumps(data, separators=(",", ":"))
+
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, locked_update, self.path, merge)
+            except OSError:
+                for name, mapping in self.mappings.items():
+                    mapping.forgotten = {**ours[name][2], **mapping.forgotten}
+                    mapping.dirty = True
+                raise
+
+    def summary(self):
+        """Active keys per mapping"""
+        return {name: len(mapping) for name, mapping in self.mappings.items()}
+
+
+cooldowns = CooldownStore()
+
+
+def persistent_cooldown(rate: int, per: float, type=commands.BucketType.default, *,
+                        name: str = None):
+    """Like commands.cooldown, but the cooldown survives restarts and reloads"""
+
+    def decorator(func):
+        callback = func.callback if isinstance(func, commands.Command) else func
+        key = name or f"{callback.__module__}.{callback.__qualname__}"
+        mapping = cooldowns.mapping(key, rate, per, type)
+        if isinstance(func, commands.Command):
+            func._buckets = mapping
+        else:
+            func.__commands_cooldown__ = mapping
+        return func
+
+    return decorator
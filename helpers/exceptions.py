@@ -17,3 +17,28 @@ class VoiceChError(Exception):
     def __init__(self):
         self.description = "Error while playing music"
         super().__init__(self.description)
+
+
+class ConfigError(ValueError):
+    """config.json is missing a key or has a wrong value"""
+
+    def __init__(self, description: str):
+        self.description = description
+        super().__init__(self.description)
+
+
+class ExtractionError(Exception):
+    """youtube-dl could not extract a song"""
+
+    def __init__(self, description: str = "Error while looking up the song"):
+        self.description = description
+        super().__init__(self.description)
+
+
+class HTTPRequestError(Exception):
+    """An outbound HTTP request failed"""
+
+    def __init__(self, status: int, url: str, reason: str = None):
+        self.status = status
+        self.description = f"Request to {url} failed ({reason or status or 'no response'})"
+        super().__init__(self.description)
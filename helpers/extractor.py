@@ -0,0 +1,139 @@
+"""Contains youtube-dl extraction pool"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from helpers.exceptions import ExtractionError
+
+YDL_OPTIONS = {
+    "format": "bestaudio",
+    "noplaylist": True,
+    "nocheckcertificate": True,
+    "ignoreerrors": False,
+    "logtostderr": False,
+    "quiet": True,
+    "no_warnings": True,
+    "default_search": "auto",
+}
+
+# Only lists the entries of a playlist, every entry is resolved on its own later
+PLAYLIST_OPTIONS = {
+    **YDL_OPTIONS,
+    "noplaylist": False,
+    "extract_flat": "in_playlist",
+}
+
+_local = threading.local()
+
+
+def _extract(query: str, options: dict):
+    """Run youtube-dl in a pool worker, every worker keeps its own YoutubeDL"""
+
+    started = time.time()
+    instances = getattr(_local, "instances", None)
+    if instances is None:
+        instances = _local.instances = {}
+    key = tuple(sorted(options.items()))
+    ytdl = instances.get(key)
+    if ytdl is None:
+        from youtube_dl import YoutubeDL
+        ytdl = instances[key] = YoutubeDL(options)
+    data = ytdl.extract_info(query, download=False)
+    return started, time.time(), data
+
+
+class ExtractorStats:
+    """Time spent waiting for a worker versus time spent extracting"""
+
+    __slots__ = ("requests", "failures", "timeouts", "cancelled",
+                 "queued_total", "queued_max", "extract_total", "extract_max")
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.queued_total = 0.0
+        self.queued_max = 0.0
+        self.extract_total = 0.0
+        self.extract_max = 0.0
+
+    def record(self, queued: float, extracting: float):
+        """Record one finished extraction"""
+
+        self.requests += 1
+        self.queued_total += queued
+        self.queued_max = max(self.queued_max, queued)
+        self.extract_total += extracting
+        self.extract_max = max(self.extract_max, extracting)
+
+    def summary(self):
+        """Averages and maxima in seconds"""
+
+        done = self.requests or 1
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "queued_avg": self.queued_total / done,
+            "queued_max": self.queued_max,
+            "extract_avg": self.extract_total / done,
+            "extract_max": self.extract_max,
+        }
+
+
+class Extractor:
+    """Runs youtube-dl off the event loop with a global concurrency cap"""
+
+    def __init__(self, kind: str = "thread", workers: int = 4,
+                 concurrency: int = None, timeout: float = 30.0):
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ytdl")
+        self.timeout = timeout
+        self.stats = ExtractorStats()
+        self._semaphore = asyncio.Semaphore(concurrency or workers)
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the extractor from the `music` section of config.json"""
+
+        music = config.get("music", {})
+        return cls(kind=music.get("extractor", "thread"),
+                   workers=music.get("extract_workers", 4),
+                   concurrency=music.get("extract_concurrency"),
+                   timeout=music.get("extract_timeout", 30.0))
+
+    async def _run(self, query: str, options: dict, requested: float):
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            started, finished, data = await loop.run_in_executor(
+                self.executor, _extract, query, options)
+        self.stats.record(started - requested, finished - started)
+        return data
+
+    async def extract(self, query: str, options: dict = None):
+        """Extract info for query, raises ExtractionError on failure or timeout"""
+
+        try:
+            return await asyncio.wait_for(
+                self._run(query, options or YDL_OPTIONS, time.time()), self.timeout)
+        except asyncio.TimeoutError as e:
+            self.stats.timeouts += 1
+            raise ExtractionError(f"Timed out looking up `{query}`") from e
+        except asyncio.CancelledError:
+            # The requesting command went away, the queued job is dropped with it
+            self.stats.cancelled += 1
+            raise
+        except Exception as e:
+            self.stats.failures += 1
+            raise ExtractionError(f"Could not look up `{query}`") from e
+
+    def shutdown(self):
+        """Stop the worker pool without waiting for running extractions"""
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,196 @@
+"""Contains the FFmpeg process budget"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+
+from helpers.procstat import CLOCK_TICKS, PAGE_SIZE, read_stat
+
+log = logging.getLogger("tg9.ffmpeg")
+
+POSITION_INTERVAL = 5.0  # Seconds between queue position updates of a waiting guild
+STALL_TIMEOUT = 30.0  # A playing FFmpeg without CPU progress for this long is killed
+ORPHAN_GRACE = 10.0  # Seconds a cleaned up FFmpeg may take to exit before it is killed
+
+
+class Lease:
+    """Permission to run one FFmpeg process, plus its latest /proc readings"""
+
+    __slots__ = ("guild_id", "process", "voice_client", "granted",
+                 "cpu", "cpu_percent", "rss", "sampled", "progressed")
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.process = None
+        self.voice_client = None
+        self.granted = time.monotonic()
+        self.cpu = 0.0
+        self.cpu_percent = 0.0
+        self.rss = 0
+        self.sampled = self.progressed = self.granted
+
+    def attach(self, source, voice_client):
+        """Watch the FFmpeg process of an FFmpegOpusAudio playing on voice_client"""
+
+        self.process = getattr(source, "_process", None)
+        self.voice_client = voice_client
+        self.sampled = self.progressed = time.monotonic()
+
+
+class FFmpegBudget:
+    """Caps concurrent FFmpeg processes, admitting waiting guilds round-robin
+
+    A slot freed by release() goes straight to the next waiting guild, so a
+    guild asking again for its next song queues up behind the others. check()
+    samples CPU and RSS of every process from /proc, kills processes that stopped
+    making progress while their guild is playing and reaps exited ones.
+    """
+
+    def __init__(self, max_processes: int = 64, stall_timeout: float = STALL_TIMEOUT):
+        self.max_processes = max_processes
+        self.stall_timeout = stall_timeout
+        self.leases = set()
+        self.waiting = OrderedDict()  # guild id -> deque of futures, rotation order
+        self.orphans = {}  # pid -> (Popen, released at)
+        self.granted = 0
+        self.queued = 0
+        self.stalled = 0
+        self.reaped = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Budget from the `music` section of config.json, split between clusters"""
+
+        music = config.get("music", {})
+        clusters = int(os.environ.get("CLUSTER_COUNT", 1))
+        return cls(max_processes=max(1, math.ceil(music.get("ffmpeg_max_processes", 64)
+                                                  / clusters)),
+                   stall_timeout=music.get("ffmpeg_stall_timeout", STALL_TIMEOUT))
+
+    def position(self, guild_id: int):
+        """1-based place of a guild in the rotation, 0 if it is not waiting"""
+
+        for number, waiting_guild in enumerate(self.waiting, 1):
+            if waiting_guild == guild_id:
+                return number
+        return 0
+
+    async def acquire(self, guild_id: int, on_position=None):
+        """Wait for a slot, on_position(position) is awaited whenever the place changes"""
+
+        if len(self.leases) < self.max_processes and not self.waiting:
+            return self._grant(guild_id)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(guild_id, deque()).append(future)
+        self.queued += 1
+        try:
+            shown = None
+            while not future.done():
+                position = self.position(guild_id)
+                if on_position is not None and position != shown:
+                    shown = position
+                    await on_position(position)
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), POSITION_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            return future.result()
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Granted while we were being cancelled, pass the slot on
+                self.release(future.result())
+            else:
+                future.cancel()
+                self._forget(guild_id, future)
+            raise
+
+    def release(self, lease: Lease):
+        """Give a slot back; the process, if any, is reaped by check()"""
+
+        if lease not in self.leases:
+            return
+        self.leases.discard(lease)
+        if lease.process is not None and lease.process.poll() is None:
+            self.orphans[lease.process.pid] = (lease.process, time.monotonic())
+        self._grant_next()
+
+    def _grant(self, guild_id: int):
+        lease = Lease(guild_id)
+        self.leases.add(lease)
+        self.granted += 1
+        return lease
+
+    def _grant_next(self):
+        while self.waiting and len(self.leases) < self.max_processes:
+            guild_id, futures = next(iter(self.waiting.items()))
+            future = futures.popleft()
+            if futures:
+                self.waiting.move_to_end(guild_id)
+            else:
+                del self.waiting[guild_id]
+            if not future.done():
+                future.set_result(self._grant(guild_id))
+
+    def _forget(self, guild_id: int, future):
+        futures = self.waiting.get(guild_id)
+        if futures is None:
+            return
+        try:
+            futures.remove(future)
+        except ValueError:
+            pass
+        if not futures:
+            del self.waiting[guild_id]
+
+    def check(self):
+        """Sample running processes, kill stalled ones and reap exited ones"""
+
+        now = time.monotonic()
+        for lease in list(self.leases):
+            if lease.process is None:
+                continue
+            fields = read_stat(lease.process.pid)
+            if fields is None or fields[0] == "Z":
+                continue  # Exited, the player notices and releases the lease
+            cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            lease.cpu_percent = (cpu - lease.cpu) / max(now - lease.sampled, 1e-6) * 100
+            lease.rss = int(fields[21]) * PAGE_SIZE
+            lease.sampled = now
+            if cpu > lease.cpu:
+                lease.cpu = cpu
+                lease.progressed = now
+            elif (lease.voice_client is not None and lease.voice_client.is_playing()
+                  and now - lease.progressed > self.stall_timeout):
+                # Ends the song, the player moves on and releases the lease
+                log.warning("Killing stalled FFmpeg %s of guild %s",
+                            lease.process.pid, lease.guild_id)
+                lease.process.kill()
+                self.stalled += 1
+
+        for pid, (process, released) in list(self.orphans.items()):
+            if process.poll() is not None:
+                # poll() collected the exit status, no zombie is left behind
+                del self.orphans[pid]
+                self.reaped += 1
+            elif now - released > ORPHAN_GRACE:
+                log.warning("Killing FFmpeg %s that outlived its cleanup", pid)
+                process.kill()
+
+    def summary(self):
+        """Usage for the musicstats command and metrics"""
+
+        return {
+            "running": len(self.leases),
+            "max": self.max_processes,
+            "waiting": sum(len(futures) for futures in self.waiting.values()),
+            "cpu_percent": sum(lease.cpu_percent for lease in self.leases),
+            "rss": sum(lease.rss for lease in self.leases),
+            "granted": self.granted,
+            "queued": self.queued,
+            "stalled": self.stalled,
+            "reaped": self.reaped,
+            "orphans": len(self.orphans),
+        }
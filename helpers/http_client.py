@@ -0,0 +1,95 @@
+"""Contains the shared HTTP client"""
+
+import asyncio
+
+import aiohttp
+
+from helpers.exceptions import HTTPRequestError
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPClient:
+    """One pooled aiohttp session for every cog, owned by the bot"""
+
+    def __init__(self, *, limit: int = 100, limit_per_host: int = 10,
+                 timeout: float = 10.0, retries: int = 3, backoff: float = 0.5):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+        self._inflight = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the client from the `http` section of config.json"""
+
+        http = config.get("http", {})
+        return cls(limit=http.get("limit", 100),
+                   limit_per_host=http.get("limit_per_host", 10),
+                   timeout=http.get("timeout", 10.0),
+                   retries=http.get("retries", 3),
+                   backoff=http.get("backoff", 0.5))
+
+    async def start(self):
+        """Open the session, call it from setup_hook"""
+
+        connector = aiohttp.TCPConnector(limit=self.limit,
+                                         limit_per_host=self.limit_per_host,
+                                         ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self):
+        """Close the session and its pooled connections"""
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _request_json(self, method: str, url: str, **kwargs):
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    if response.status == 200:
+                        try:
+                            return await response.json(content_type=None)
+                        except ValueError as e:
+                            # An HTML error page or a cut off body, retrying rarely helps
+                            raise HTTPRequestError(response.status, url, "invalid JSON") from e
+                    if response.status not in RETRY_STATUSES or attempt == self.retries:
+                        raise HTTPRequestError(response.status, url)
+                    retry_after = response.headers.get("Retry-After")
+                    if retry_after is not None:
+                        try:
+                            delay = max(delay, float(retry_after))
+                        except ValueError:
+                            pass
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise HTTPRequestError(None, url) from e
+            await asyncio.sleep(delay)
+
+    def _forget(self, key, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved when every caller went away
+
+    async def get_json(self, url: str, *, params: dict = None):
+        """GET url and decode JSON, identical requests in flight share one response
+
+        The decoded object may be shared between callers, do not mutate it.
+        """
+
+        key = (url, tuple(sorted((params or {}).items())))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(
+                self._request_json("GET", url, params=params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # Shielded so one cancelled caller does not cancel the others
+        return await asyncio.shield(task)
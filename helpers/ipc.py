@@ -0,0 +1,184 @@
+"""Contains the cluster IPC channel
+
+Clusters connect to the launcher over a local TCP socket and exchange one JSON
+object per line: {"op": str, "data": ..., "cluster": int, "id": int?}.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+log = logging.getLogger("tg9.ipc")
+
+HEALTH_INTERVAL = 10.0  # Seconds between health reports of a cluster
+
+
+async def send_line(writer: asyncio.StreamWriter, message: dict):
+    """Write one message"""
+
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+
+class IPCServer:
+    """Launcher side: relays broadcasts between clusters and aggregates health"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.clusters = {}  # cluster id -> writer
+        self.health = {}  # cluster id -> last health report
+        self.shutdown_requested = asyncio.Event()
+        self._server = None
+
+    async def start(self):
+        """Start listening, returns the bound port"""
+
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        """Stop listening and drop every cluster connection"""
+
+        for writer in self.clusters.values():
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def broadcast(self, op: str, data=None, *, exclude: int = None):
+        """Send a message to every connected cluster"""
+
+        for cluster_id, writer in list(self.clusters.items()):
+            if cluster_id == exclude:
+                continue
+            try:
+                await send_line(writer, {"op": op, "data": data, "cluster": exclude})
+            except (ConnectionError, RuntimeError):
+                self.clusters.pop(cluster_id, None)
+
+    def aggregate(self):
+        """Health of every cluster plus totals"""
+
+        now = time.time()
+        clusters = {}
+        for cluster_id, report in sorted(self.health.items()):
+            clusters[str(cluster_id)] = {**report, "age": now - report["time"],
+                                         "connected": cluster_id in self.clusters}
+        return {
+            "clusters": clusters,
+            "guilds": sum(report.get("guilds", 0) for report in self.health.values()),
+            "shards": sum(len(report.get("shards", ())) for report in self.health.values()),
+        }
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        cluster_id = None
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                cluster_id = message.get("cluster")
+                op = message["op"]
+                if op == "hello":
+                    self.clusters[cluster_id] = writer
+                    log.info("Cluster %s connected", cluster_id)
+                elif op == "health":
+                    self.health[cluster_id] = {**message["data"], "time": time.time()}
+                elif op == "broadcast":
+                    inner = message["data"]
+                    if inner["op"] == "shutdown":
+                        self.shutdown_requested.set()
+                    await self.broadcast(inner["op"], inner.get("data"), exclude=cluster_id)
+                elif op == "request" and message["data"] == "health":
+                    await send_line(writer, {"op": "reply", "id": message["id"],
+                                             "data": self.aggregate()})
+        except (ConnectionError, ValueError, KeyError) as e:
+            log.warning("Dropping cluster %s connection: %s", cluster_id, e)
+        finally:
+            if self.clusters.get(cluster_id) is writer:
+                del self.clusters[cluster_id]
+                log.info("Cluster %s disconnected", cluster_id)
+            writer.close()
+
+
+class IPCClient:
+    """Cluster side: receives broadcasts and reports health to the launcher"""
+
+    def __init__(self, host: str, port: int, cluster_id: int, health_provider=None):
+        self.host = host
+        self.port = port
+        self.cluster_id = cluster_id
+        self.health_provider = health_provider
+        self.handlers = {}  # op -> coroutine function(data)
+        self._writer = None
+        self._tasks = []
+        self._ids = itertools.count()
+        self._replies = {}
+
+    async def start(self):
+        """Connect and start the reader and health tasks"""
+
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        await self._send("hello")
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._read(reader)),
+                       loop.create_task(self._report_health())]
+
+    async def close(self):
+        """Disconnect"""
+
+        for task in self._tasks:
+            task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _send(self, op: str, data=None, **extra):
+        await send_line(self._writer, {"op": op, "data": data,
+                                       "cluster": self.cluster_id, **extra})
+
+    async def broadcast(self, op: str, data=None):
+        """Ask the launcher to run op on every other cluster"""
+        await self._send("broadcast", {"op": op, "data": data})
+
+    async def request(self, what: str, timeout: float = 5.0):
+        """Ask the launcher for data, e.g. aggregated health"""
+
+        request_id = next(self._ids)
+        future = self._replies[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self._send("request", what, id=request_id)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._replies.pop(request_id, None)
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while line := await reader.readline():
+            message = json.loads(line)
+            if message["op"] == "reply":
+                future = self._replies.get(message["id"])
+                if future is not None and not future.done():
+                    future.set_result(message["data"])
+                continue
+            func = self.handlers.get(message["op"])
+            if func is None:
+                continue
+            try:
+                await func(message.get("data"))
+            except Exception:
+                log.exception("IPC handler for %s failed", message["op"])
+        log.warning("Lost connection to the launcher")
+        for future in self._replies.values():
+            if not future.done():
+                future.set_exception(ConnectionError("lost connection to the launcher"))
+
+    async def _report_health(self):
+        while True:
+            if self.health_provider is not None:
+                try:
+                    await self._send("health", self.health_provider())
+                except ConnectionError:
+                    return
+            await asyncio.sleep(HEALTH_INTERVAL)
@@ -0,0 +1,157 @@
+"""Contains the event loop lag watchdog"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+log = logging.getLogger("tg9.lag")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_SITES = 50  # Call sites remembered, the least frequent one is dropped first
+STACK_DEPTH = 30  # Innermost frames kept of a captured stack
+
+
+def call_site(stack: traceback.StackSummary):
+    """Innermost frame in our own code, so a stall inside a library points at its caller"""
+
+    for frame in reversed(stack):
+        filename = os.path.abspath(frame.filename)
+        if (filename.startswith(ROOT + os.sep) and "site-packages" not in filename
+                and filename != os.path.abspath(__file__)):
+            return frame
+    return stack[-1]
+
+
+class LagSite:
+    """Stalls attributed to one call site"""
+
+    __slots__ = ("where", "count", "total", "worst", "stack", "last")
+
+    def __init__(self, where: str):
+        self.where = where
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.stack = None  # Formatted stack of the worst stall
+        self.last = 0.0
+
+    def record(self, duration: float, stack: str):
+        """Count one stall"""
+
+        self.count += 1
+        self.total += duration
+        self.last = time.time()
+        if duration >= self.worst:
+            self.worst = duration
+            self.stack = stack
+
+
+class LagMonitor:
+    """Measures event loop lag and captures what the loop was doing when it stalled
+
+    A task on the loop wakes every interval and notes when it ran. A helper
+    thread checks that note; once the loop is more than threshold late it grabs
+    the loop thread's stack from sys._current_frames(). When the loop gets back
+    to the task, the stall's full duration is recorded against that stack.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.sites = {}  # "file:line in function" -> LagSite
+        self.stalls = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._expected = None  # When the heartbeat should run next, monotonic
+        self._captured = None  # (where, formatted stack) of the ongoing stall
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Monitor from the lag_monitor section of config.json, None unless enabled"""
+
+        settings = config.get("lag_monitor", {})
+        if not settings.get("enabled"):
+            return None
+        return cls(threshold=settings.get("threshold", 0.25),
+                   interval=settings.get("interval", 0.1))
+
+    def start(self):
+        """Start watching the running loop"""
+
+        self._loop_thread = threading.get_ident()
+        self._expected = time.monotonic() + self.interval
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="lag-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the heartbeat and the helper thread"""
+
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                lag = now - self._expected
+                captured, self._captured = self._captured, None
+                self._expected = now + self.interval
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if captured is not None and lag >= self.threshold:
+                self._record(lag, *captured)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            # Only the frame is taken under the lock, the heartbeat never waits on formatting
+            with self._lock:
+                if self._captured is not None or self._expected is None:
+                    continue
+                if time.monotonic() - self._expected < self.threshold:
+                    continue
+                expected = self._expected
+                frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=STACK_DEPTH)
+            del frame
+            site = call_site(stack)
+            captured = (f"{os.path.relpath(site.filename, ROOT)}:{site.lineno} in {site.name}",
+                        "".join(stack.format()))
+            with self._lock:
+                # Dropped if the stall ended meanwhile, it belongs to no later one
+                if self._captured is None and self._expected == expected:
+                    self._captured = captured
+
+    def _record(self, duration: float, where: str, stack: str):
+        self.stalls += 1
+        site = self.sites.get(where)
+        if site is None:
+            if len(self.sites) >= MAX_SITES:
+                del self.sites[min(self.sites, key=lambda key: self.sites[key].count)]
+            site = self.sites[where] = LagSite(where)
+        site.record(duration, stack)
+        log.warning("Event loop blocked for %.0fms at %s\n%s", duration * 1000, where, stack)
+
+    def top(self, count: int = 10):
+        """Call sites with the worst stalls first"""
+        return sorted(self.sites.values(), key=lambda site: site.worst, reverse=True)[:count]
+
+    def reset(self):
+        """Forget recorded stalls"""
+
+        self.sites.clear()
+        self.stalls = 0
+        self.max_lag = 0.0
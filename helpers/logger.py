@@ -0,0 +1,184 @@
+"""Contains the non-blocking logging setup"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+log = logging.getLogger("tg9")
+
+CONTEXT_FIELDS = ("event", "guild", "guild_id", "user", "user_id", "command")
+DEFAULT_SAMPLE = {"command_completion": 10}  # Events kept one in N unless configured
+
+
+def context_fields(ctx, event: str):
+    """Structured fields of a command invocation"""
+
+    return {
+        "event": event,
+        "guild": ctx.guild.name if ctx.guild else None,
+        "guild_id": ctx.guild.id if ctx.guild else None,
+        "user": str(ctx.author),
+        "user_id": ctx.author.id,
+        "command": ctx.command.qualified_name if ctx.command else None,
+    }
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler which drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in every N records of an event type"""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self.seen = {}
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if getattr(record, "presampled", False):
+            # keep() was asked before the record was built
+            return True
+        return self.keep(getattr(record, "event", None), record.levelno)
+
+    def keep(self, event: str, level: int = logging.INFO):
+        """Count one record of event, returns whether it is kept"""
+
+        rate = self.rates.get(event, 1)
+        if rate <= 1 or level >= logging.WARNING:
+            return True
+        count = self.seen[event] = self.seen.get(event, 0) + 1
+        if count % rate == 1:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """StreamHandler writing to sys.stdout as it is when a record is written"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, _stream):
+        pass  # Always follows sys.stdout
+
+
+class BlockingStopListener(logging.handlers.QueueListener):
+    """QueueListener whose stop() waits for room instead of raising queue.Full"""
+
+    def enqueue_sentinel(self):
+        # The writer thread keeps draining, so this returns once it catches up
+        self.queue.put(self._sentinel)
+
+
+def cluster_log_file(path: str):
+    """Log file of this process, one per cluster so they never rotate each other's file"""
+
+    cluster_id = os.environ.get("CLUSTER_ID")
+    if cluster_id is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-cluster{cluster_id}{ext}"
+
+
+class LogPipeline:
+    """Queue handler in front of a background writer thread"""
+
+    def __init__(self, handler: DroppingQueueHandler, sampler: SamplingFilter,
+                 listener: logging.handlers.QueueListener):
+        self.handler = handler
+        self.sampler = sampler
+        self.listener = listener
+        self.running = True
+
+    @property
+    def dropped(self):
+        """Records dropped because the queue was full"""
+        return self.handler.dropped
+
+    def wants(self, event: str, level: int = logging.INFO):
+        """Whether a record of event would be written, so callers can skip building it"""
+        return log.isEnabledFor(level) and self.sampler.keep(event, level)
+
+    def stop(self):
+        """Write out queued records and stop the writer thread"""
+
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+
+def setup_logging(config):
+    """Route the tg9 and discord loggers through a bounded queue, returns a LogPipeline"""
+
+    settings = config.get("logging", {})
+    if settings.get("format", "json") == "json":
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}",
+                                      "%Y-%m-%d %H:%M:%S", style="{")
+
+    handlers = [ConsoleHandler()]
+    if settings.get("file"):
+        path = cluster_log_file(settings["file"])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            path, maxBytes=settings.get("max_bytes", 10 * 1024 * 1024),
+            backupCount=settings.get("backup_count", 5), encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=settings.get("queue_size", 10000))
+    queue_handler = DroppingQueueHandler(log_queue)
+    sampler = SamplingFilter(settings.get("sample", DEFAULT_SAMPLE))
+    queue_handler.addFilter(sampler)
+    listener = BlockingStopListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    level = settings.get("level", "INFO")
+    for name in ("tg9", "discord"):
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+    return LogPipeline(queue_handler, sampler, listener)
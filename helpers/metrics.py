@@ -0,0 +1,175 @@
+"""Contains command metrics and the Prometheus endpoint"""
+
+import bisect
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    """Render {name="value",...}"""
+
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        """Increase the counter of a label set"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        """(suffix, labels, value) rows"""
+        for labels, value in self.values.items():
+            yield "", format_labels(self.labelnames, labels), value
+
+
+class Gauge:
+    """Value read from a callback when metrics are collected"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, func):
+        self.name = name
+        self.description = description
+        self.func = func
+
+    def samples(self):
+        """(suffix, labels, value) rows"""
+        yield "", "", self.func()
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels):
+        """Record one value"""
+
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels):
+        """Number of observations of a label set"""
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def quantile(self, q: float, *labels):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+
+        series = self.series.get(labels)
+        if not series:
+            return None
+        target = q * sum(series[:-1])
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+            running += count
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        """(suffix, labels, value) rows"""
+
+        for labels, series in self.series.items():
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                running += count
+                yield "_bucket", format_labels(self.labelnames + ("le",),
+                                               labels + (bound,)), running
+            yield "_sum", format_labels(self.labelnames, labels), series[-1]
+            yield "_count", format_labels(self.labelnames, labels), running
+
+
+class Metrics:
+    """Registry of the bot's metrics"""
+
+    def __init__(self):
+        self.registry = []
+        self.command_latency = self.add(Histogram(
+            "tg9_command_latency_seconds",
+            "Time from message receipt to command completion", ("command",)))
+        self.command_errors = self.add(Counter(
+            "tg9_command_errors_total", "Command errors by exception type",
+            ("command", "error")))
+
+    def add(self, metric):
+        """Register a metric"""
+
+        self.registry.append(metric)
+        return metric
+
+    def gauge(self, name: str, description: str, func):
+        """Register a callback gauge"""
+        return self.add(Gauge(name, description, func))
+
+    def render(self):
+        """Prometheus text exposition format"""
+
+        lines = []
+        for metric in self.registry:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving /metrics"""
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9090):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def handle(self, _request):
+        """GET /metrics"""
+        return web.Response(text=self.metrics.render(),
+                            content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        """Start listening"""
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self):
+        """Stop listening"""
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
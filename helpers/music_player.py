@@ -1,71 +1,187 @@
 """Contains Music Player"""
 
 import asyncio
-from async_timeout import timeout
+import itertools
+import time
 
 import discord
 from discord.ext import commands
-from youtube_dl import YoutubeDL
+
+from helpers.extractor import Extractor, PLAYLIST_OPTIONS
+from helpers.exceptions import ExtractionError
+from helpers.procstat import cpu_seconds
+from helpers.song_cache import STREAM_MARGIN, SongCache
+from helpers.song_queue import SongQueue
 
 FFMPEG_OPTIONS = {
     "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
     "options": "-vn",
 }
-YDL_OPTIONS = {
-    "format": "bestaudio",
-    "noplaylist": True,
-    "nocheckcertificate": True,
-    "ignoreerrors": False,
-    "logtostderr": False,
-    "quiet": True,
-    "no_warnings": True,
-    "default_search": "auto",
-}
 
-ytdl = YoutubeDL(YDL_OPTIONS)
+
+def stream_codec(fmt: dict):
+    """(codec, bitrate) for FFmpegOpusAudio from format metadata, (None, None) if unknown
+
+    discord.py stream copies "opus" and transcodes anything else with libopus,
+    so an Opus stream is only remuxed and neither case needs an ffprobe run.
+    """
+
+    codec = fmt.get("acodec")
+    if not codec or codec == "none":
+        return None, None
+    return codec, min(round(fmt.get("abr") or 128), 512)
+
+
+class StreamCPUStats:
+    """FFmpeg CPU time per second of audio, remuxed Opus versus transcoded streams"""
+
+    def __init__(self):
+        self.modes = {"copy": [0, 0.0, 0.0], "transcode": [0, 0.0, 0.0]}  # streams, CPU s, audio s
+
+    def record(self, codec: str, cpu: float, seconds: float):
+        """Account for one finished stream"""
+
+        totals = self.modes["copy" if codec == "opus" else "transcode"]
+        totals[0] += 1
+        totals[1] += cpu
+        totals[2] += seconds
+
+    def summary(self):
+        """Streams and CPU usage in percent of one core per mode"""
+
+        return {mode: {"streams": streams,
+                       "cpu_percent": cpu / seconds * 100 if seconds else 0.0}
+                for mode, (streams, cpu, seconds) in self.modes.items()}
 
 
 class YTDLSource:
-    """Create YTDL Source for playing music"""
+    """Queued song, the FFmpeg source is only created right before it plays"""
+
+    __slots__ = ("requester", "title", "webpage_url", "video_id", "duration",
+                 "url", "expires", "codec", "bitrate", "source", "_resolving")
 
-    def __init__(self, source, *, data, requester):
-        self.source = source
+    def __init__(self, *, data, requester):
         self.requester = requester
+        self.source = None
+        self._resolving = None
+        self.update(data)
+
+    def __getitem__(self, item: str):
+        return getattr(self, item)
+
+    def update(self, data: dict):
+        """Take metadata and the stream URL from a song cache entry"""
 
-        self.webpage_url = data.get("webpage_url")
         self.title = data.get("title")
+        self.webpage_url = data.get("webpage_url")
+        self.video_id = data.get("id")
+        self.duration = data.get("duration")
+        url = data["format"]["url"]
+        if url != getattr(self, "url", None):
+            self.codec, self.bitrate = stream_codec(data["format"])
+        self.url = url
+        self.expires = data["expires"]
 
-    def __getitem__(self, item: str):
-        return self.__getattribute__(item)
+    def is_fresh(self, margin: float = STREAM_MARGIN):
+        """Whether the stream URL can still be played"""
+        return self.expires - margin > time.time()
 
     @classmethod
-    async def create_source(cls, ctx, search: str, *, loop):
-        """Create source from song name"""
-
-        loop = loop or asyncio.get_event_loop()
+    async def lookup(cls, search: str, *, extractor: Extractor, cache: SongCache):
+        """Find song metadata, from the cache when possible"""
 
-        data = ytdl.extract_info(f"ytsearch:{search}", download=False)
+        song = cache.get(search)
+        if song is not None and cache.is_fresh(song):
+            return song
+        if song is not None:
+            # Metadata is known, only the stream URL has to be refreshed
+            data = await extractor.extract(song["webpage_url"])
+            return cache.put(search, data)
 
+        data = await extractor.extract(f"ytsearch:{search}")
         if "entries" in data:
             # take first item from a playlist
             data = data["entries"][0]
-            url = data["formats"][0]["url"]
-            name = data["title"]
+        return cache.put(search, data)
+
+    @classmethod
+    def from_flat(cls, entry: dict, requester):
+        """Placeholder for a flat playlist entry, resolved before it plays"""
+
+        video_id = entry.get("id") or entry.get("url")
+        url = entry.get("url") or video_id
+        if not url.startswith("http"):
+            url = f"https://www.youtube.com/watch?v={video_id}"
+        data = {
+            "id": video_id,
+            "title": entry.get("title") or url,
+            "webpage_url": url,
+            "duration": entry.get("duration"),
+            "format": {"url": None},
+            "expires": 0.0,
+        }
+        return cls(data=data, requester=requester)
+
+    @classmethod
+    async def create_playlist(cls, url: str, requester, *, extractor: Extractor):
+        """Create placeholder queue entries for a playlist, returns (title, entries)"""
+
+        data = await extractor.extract(url, PLAYLIST_OPTIONS)
+        entries = [cls.from_flat(entry, requester)
+                   for entry in data.get("entries") or [] if entry]
+        return data.get("title") or url, entries
+
+    @classmethod
+    async def create_source(cls, ctx, search: str, *, extractor: Extractor, cache: SongCache):
+        """Create a queue entry from song name"""
+
+        data = await cls.lookup(search, extractor=extractor, cache=cache)
+        name = data["title"]
 
         embed = discord.Embed(title="Added",
                               description=f"Added {name} to the Queue.",
                               color=0x42F56C)
         await ctx.send(embed=embed)
-        source = await discord.FFmpegOpusAudio.from_probe(url, **FFMPEG_OPTIONS)
 
-        return cls(source=source, data=data, requester=ctx.author)
+        return cls(data=data, requester=ctx.author)
+
+    async def resolve(self, *, extractor: Extractor, cache: SongCache, probe: bool = True):
+        """Refresh a stale stream URL and probe its codec, shared by concurrent callers"""
+
+        if self._resolving is None:
+            self._resolving = asyncio.get_running_loop().create_task(
+                self._resolve(extractor, cache, probe))
+        try:
+            await asyncio.shield(self._resolving)
+        finally:
+            if self._resolving is not None and self._resolving.done():
+                self._resolving = None
+
+    async def _resolve(self, extractor: Extractor, cache: SongCache, probe: bool):
+        if not self.is_fresh():
+            cached = cache.get_song(self.video_id)
+            if cached is None or not cache.is_fresh(cached):
+                cached = cache.put(None, await extractor.extract(self.webpage_url))
+            self.update(cached)
+        if probe and self.codec is None:
+            self.codec, self.bitrate = await discord.FFmpegOpusAudio.probe(self.url)
+
+    def create_audio(self, path: str = None):
+        """Start FFmpeg for the resolved stream URL, or for a cached Opus file"""
+
+        if path is not None:
+            self.source = discord.FFmpegOpusAudio(path, codec="opus", options="-vn")
+        else:
+            self.source = discord.FFmpegOpusAudio(self.url, codec=self.codec,
+                                                  bitrate=self.bitrate, **FFMPEG_OPTIONS)
+        return self.source
 
 
 class MusicPlayer:
     """Music player loop"""
 
-    __slots__ = ("bot", "_guild", "_channel", "_cog",
-                 "queue", "next", "current", "now_playing_msg")
+    __slots__ = ("bot", "_guild", "_channel", "_cog", "task",
+                 "queue", "next", "current", "now_playing_msg", "prefetch_depth")
 
     def __init__(self, ctx):
         self.bot: commands.Bot = ctx.bot
@@ -73,53 +189,201 @@ class MusicPlayer:
         self._channel = ctx.channel
         self._cog = ctx.cog
 
-        self.queue = asyncio.Queue()
+        self.queue = SongQueue()
         self.next = asyncio.Event()
 
         self.now_playing_msg = None  # Now playing message
         self.current = None
+        # Resolve this many upcoming songs while the current one plays
+        self.prefetch_depth = ctx.bot.config.get("music", {}).get("prefetch", 2)
 
-        ctx.bot.loop.create_task(self.player_loop())
+        # No task until something is queued, the cog's idle wheel times us out
+        self.task = None
+        self._cog.mark_idle(self._guild.id)
+
+    @property
+    def busy(self):
+        """Whether the player loop is running, i.e. a song is playing or about to"""
+        return self.task is not None and not self.task.done()
+
+    def wake(self):
+        """Start the player loop after songs were queued, no-op while it runs"""
+
+        if self.busy or self.queue.empty():
+            return
+        self._cog.mark_busy(self._guild.id)
+        self.task = self.bot.loop.create_task(self.player_loop())
+
+    def close(self):
+        """Stop the player loop and drop the queue"""
+
+        if self.task is not None:
+            self.task.cancel()
+        self.queue.clear()
 
     async def player_loop(self):
-        """Our main player loop."""
+        """Play queued songs until the queue runs dry, then park"""
 
+        try:
+            await self._play_queue()
+        finally:
+            # Also after a failure, so the idle wheel eventually disconnects us
+            self.current = None
+            self._cog.mark_idle(self._guild.id)
+
+    async def _play_queue(self):
         await self.bot.wait_until_ready()
 
         while not self.bot.is_closed():
             self.next.clear()
 
             try:
-                # Wait for the next song. If we timeout cancel the player and disconnect...
-                async with timeout(300):  # 5 minutes...
-                    song: YTDLSource = await self.queue.get()
-            except asyncio.TimeoutError:
-                embed = discord.Embed(title="Disconnected",
-                                      description="Bot Disconnected due to Emptiness feeling",
-                                      color=0xE02B2B)
-                await self._channel.send(embed=embed)
-                return self.destroy(self._guild)
-
-            self.current = song
-
-            self._guild.voice_client.play(song.source,
+                song: YTDLSource = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                # Nothing left, end the task; wake() starts a new one
+                return
+
+            audio_cache = self._cog.audio_cache
+            path = audio_cache.lookup(song.video_id) if audio_cache is not None else None
+            try:
+                if path is None:
+                    # Usually a no-op, the song was resolved while the previous one played
+                    await song.resolve(extractor=self._cog.extractor, cache=self._cog.song_cache)
+            except ExtractionError as e:
+                await self._skip(song, e)
+                continue
+
+            lease = await self.wait_for_slot()
+            try:
+                await self._play(song, path, audio_cache, lease)
+            except discord.ClientException as e:
+                await self._skip(song, e)
+            finally:
+                self.ffmpeg_budget.release(lease)
+
+    @property
+    def ffmpeg_budget(self):
+        """Host FFmpeg process budget, shared by every player"""
+        return self._cog.ffmpeg_budget
+
+    async def _skip(self, song: YTDLSource, error: Exception):
+        embed = discord.Embed(title="Error!",
+                              description=f"Skipping `{song.title}`: {error}",
+                              color=0xE02B2B)
+        await self._channel.send(embed=embed)
+
+    async def wait_for_slot(self):
+        """FFmpeg lease from the host budget, telling the channel its place while it waits"""
+
+        message = None
+
+        async def show_position(position: int):
+            nonlocal message
+            embed = discord.Embed(title="Waiting for a free audio slot",
+                                  description=f"The bot is busy, you are #{position} in line.",
+                                  color=0xF59E42)
+            try:
+                if message is None:
+                    message = await self._channel.send(embed=embed)
+                else:
+                    await message.edit(embed=embed)
+            except discord.HTTPException:
+                pass
+
+        try:
+            return await self.ffmpeg_budget.acquire(self._guild.id, show_position)
+        finally:
+            if message is not None:
+                try:
+                    await message.delete()
+                except discord.HTTPException:
+                    pass
+
+    async def _play(self, song: YTDLSource, path: str, audio_cache, lease):
+        """Play one song under an FFmpeg lease and wait until it ends"""
+
+        source = song.create_audio(path)
+        lease.attach(source, self._guild.voice_client)
+        try:
+            self._guild.voice_client.play(source,
                                           after=lambda _: self.bot.loop.call_soon_threadsafe(
                                               self.next.set)
                                           )
-            np_text = (f"**Now Playing:** `{song.title}` requested by "
-                       f"`{song.requester}`\n{song.webpage_url}")
+        except discord.ClientException:
+            source.cleanup()
+            song.source = None
+            raise
+
+        self.current = song
+        if path is None and audio_cache is not None:
+            # Stores the song in the background once it was played often enough
+            audio_cache.played(song)
+        started = time.monotonic()
+        np_text = (f"**Now Playing:** `{song.title}` requested by "
+                   f"`{song.requester}`\n{song.webpage_url}")
+        try:
             self.now_playing_msg = await self._channel.send(np_text)
-            await self.next.wait()
+        except discord.HTTPException:
+            # The song plays on, FFmpeg must keep its lease until it ends
+            self.now_playing_msg = None
+        self.prefetch()
+        await self.next.wait()
 
-            # Make sure the FFmpeg process is cleaned up.
-            song.source.cleanup()
-            self.current = None
+        stream_stats = self._cog.stream_stats
+        if stream_stats is not None:
+            # Read before cleanup, the process is reaped there
+            cpu = cpu_seconds(source._process.pid)
+            if cpu is not None:
+                stream_stats.record("opus" if path else song.codec, cpu,
+                                    time.monotonic() - started)
+
+        # Make sure the FFmpeg process is cleaned up.
+        song.source.cleanup()
+        song.source = None
+        self.current = None
 
+        if self.now_playing_msg is not None:
             try:
                 # We are no longer playing this song...
                 await self.now_playing_msg.delete()
             except discord.HTTPException:
                 pass
+            self.now_playing_msg = None
+
+    def prefetch(self):
+        """Resolve the next songs in the background so they start without a gap"""
+
+        audio_cache = self._cog.audio_cache
+        for song in itertools.islice(self.queue, 0, self.prefetch_depth):
+            if audio_cache is not None and song.video_id in audio_cache.entries:
+                continue  # Plays from disk, no stream URL needed
+            if song._resolving is None and (not song.is_fresh() or song.codec is None):
+                task = self.bot.loop.create_task(
+                    song.resolve(extractor=self._cog.extractor, cache=self._cog.song_cache))
+                task.add_done_callback(lambda t, song=song: self._prefetched(t, song))
+
+    def _prefetched(self, task: asyncio.Task, song: YTDLSource):
+        # A failed prefetch is retried when the song comes up
+        if not task.cancelled() and task.exception() is None:
+            self.queue.update_duration(song)
+
+    async def resolve_all(self, songs, concurrency: int):
+        """Resolve many songs with bounded parallelism, returns how many failed"""
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def resolve(song: YTDLSource):
+            async with semaphore:
+                try:
+                    await song.resolve(extractor=self._cog.extractor,
+                                       cache=self._cog.song_cache, probe=False)
+                except ExtractionError:
+                    return False
+                self.queue.update_duration(song)
+                return True
+
+        results = await asyncio.gather(*(resolve(song) for song in songs))
+        return results.count(False)
 
     def destroy(self, guild: discord.Guild):
         """Disconnect and cleanup the player."""
@@ -0,0 +1,181 @@
+"""Contains write-behind JSON persistence"""
+
+import asyncio
+import copy
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows, where concurrent writers fall back to last writer wins
+
+FLUSH_DELAY = 1.0  # Seconds to batch mutations before writing
+
+
+class JSONDocument:
+    """In-memory copy of a JSON file, mutations are flushed to disk in batches"""
+
+    def __init__(self, path: str, flush_delay: float = FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.data = None
+        self.validator = None  # Called with freshly read data, raises to reject it
+        self.version = 0  # Bumped on every load or mutation
+        self._mtime = None
+        self._rejected_mtime = None
+        self._dirty = False
+        self._lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._flush_task = None
+        self.load()
+
+    def _read(self):
+        with open(self.path, encoding="utf-8") as file:
+            data = json.load(file)
+        return data, os.stat(self.path).st_mtime_ns
+
+    def _apply(self, data, mtime):
+        if self.validator is not None:
+            self.validator(data)
+        self.data = data
+        self._mtime = mtime
+        self.version += 1
+
+    def load(self):
+        """Read the file into memory"""
+
+        self._apply(*self._read())
+
+    async def reload(self):
+        """Flush pending changes and read the file again off the event loop"""
+
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        self._apply(*await loop.run_in_executor(None, self._read))
+
+    async def refresh(self):
+        """Reload the file if it was edited outside the bot, returns True on reload"""
+
+        if self._dirty or self._write_lock.locked():
+            # Our own pending changes win over external edits
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime in (self._mtime, self._rejected_mtime):
+            return False
+        try:
+            data, mtime = await asyncio.to_thread(self._read)
+            if self._dirty or self._write_lock.locked():
+                # Mutated while we were reading, keep our change
+                return False
+            self._apply(data, mtime)
+        except (ValueError, KeyError, TypeError):
+            # Report a broken edit once instead of on every check
+            self._rejected_mtime = mtime
+            raise
+        return True
+
+    async def mutate(self, func):
+        """Apply func to the data under the lock and schedule a flush
+
+        With a validator, func runs on a copy which only replaces the data once
+        it validates, so a rejected change leaves memory and disk untouched.
+        """
+
+        async with self._lock:
+            if self.validator is None:
+                result = func(self.data)
+            else:
+                data = copy.deepcopy(self.data)
+                result = func(data)
+                self.validator(data)
+                self.data = data
+            self._dirty = True
+            self.version += 1
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+        return result
+
+    async def _delayed_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_delay)
+            await self.flush()
+            if not self._dirty:
+                return
+            # Mutated during the write, mutate() saw this task running and left it to us
+
+    async def flush(self):
+        """Write pending changes to disk off the event loop"""
+
+        async with self._write_lock:
+            async with self._lock:
+                if not self._dirty:
+                    return
+                payload = json.dumps(self.data, indent=4)
+                self._dirty = False
+            loop = asyncio.get_running_loop()
+            try:
+                self._mtime = await loop.run_in_executor(None, atomic_write, self.path, payload)
+            except OSError:
+                self._dirty = True
+                raise
+
+
+def atomic_write(path: str, payload: str):
+    """Write payload to a temp file and rename it over path, returns the new mtime"""
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory,
+                                     prefix=".tmp-", delete=False) as file:
+        file.write(payload)
+        file.flush()
+        os.fsync(file.fileno())
+    try:
+        os.replace(file.name, path)
+    except OSError:
+        os.unlink(file.name)
+        raise
+    return os.stat(path).st_mtime_ns
+
+
+def locked_update(path: str, merge):
+    """Rewrite a JSON file several processes share, returns the new mtime
+
+    merge(data) gets what is on disk now (None if missing or unreadable) and
+    returns the payload to write. An exclusive lock on path.lock is held from
+    the read to the rename, so no process overwrites a change it never saw.
+    """
+
+    with open(f"{path}.lock", "a", encoding="utf-8") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            data = None
+        return atomic_write(path, merge(data))
+
+
+documents = {}
+
+
+def get_document(path: str):
+    """Retrieve the document for path, or load it"""
+
+    try:
+        return documents[path]
+    except KeyError:
+        document = documents[path] = JSONDocument(path)
+        return document
+
+
+async def flush():
+    """Flush every loaded document, used on shutdown"""
+
+    for document in list(documents.values()):
+        await document.flush()
@@ -0,0 +1,41 @@
+"""Contains per-process readings from /proc"""
+
+import os
+
+try:
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def read_stat(pid: int):
+    """Fields of /proc/<pid>/stat after the command name, None if unavailable"""
+
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as file:
+            return file.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+
+def cpu_seconds(pid: int):
+    """User plus system CPU time of a process, None if unavailable"""
+
+    fields = read_stat(pid)
+    if fields is None:
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_bytes(pid: int):
+    """Resident memory of a process, None if unavailable"""
+
+    fields = read_stat(pid)
+    if fields is None:
+        return None
+    return int(fields[21]) * PAGE_SIZE
@@ -0,0 +1,167 @@
+"""Contains the channel purge engine"""
+
+import asyncio
+import datetime
+import time
+
+import discord
+
+BULK_LIMIT = 100  # Messages per bulk delete request
+BULK_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)  # Bulk delete cutoff
+PROGRESS_INTERVAL = 3.0  # Minimum seconds between two progress updates
+BACKGROUND_THRESHOLD = 10000  # Purges at least this large run as background jobs
+SCAN_FACTOR = 10  # Filtered purges scan at most this many messages per requested one
+
+
+class PurgeFilter:
+    """Decides which messages a purge deletes"""
+
+    def __init__(self, author=None, bots: bool = False, contains: str = None):
+        self.author_id = author.id if author is not None else None
+        self.bots = bots
+        self.contains = contains.lower() if contains else None
+
+    def __bool__(self):
+        return self.author_id is not None or self.bots or self.contains is not None
+
+    def __call__(self, message):
+        if self.author_id is not None and message.author.id != self.author_id:
+            return False
+        if self.bots and not message.author.bot:
+            return False
+        if self.contains is not None and self.contains not in message.content.lower():
+            return False
+        return True
+
+    def describe(self):
+        """Human readable summary of the filters"""
+
+        parts = []
+        if self.author_id is not None:
+            parts.append(f"from <@{self.author_id}>")
+        if self.bots:
+            parts.append("from bots")
+        if self.contains is not None:
+            parts.append(f"containing `{self.contains}`")
+        return ", ".join(parts)
+
+
+class PurgeJob:
+    """Deletes up to amount matching messages from a channel, newest first
+
+    History is streamed page by page. Recent messages are deleted in bulk
+    batches of 100, messages past the bulk delete cutoff one by one. Requests
+    are sent one at a time so discord.py's per-route rate limiter paces the job.
+    """
+
+    def __init__(self, channel, amount: int, check: PurgeFilter = None, *,
+                 before=None, after=None, progress=None):
+        self.channel = channel
+        self.amount = amount
+        self.check = check or PurgeFilter()
+        self.before = before
+        self.after = after
+        self.progress = progress  # Coroutine function(job), called at most every PROGRESS_INTERVAL
+        self.scanned = 0
+        self.deleted = 0
+        self.cancelled = False
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.task = None
+        self._reported = 0.0
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def start(self):
+        """Run the job in a task, returns the task"""
+
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    def cancel(self):
+        """Stop the job after the request in flight"""
+
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        """Purge, reporting progress; cancellation and API errors end the job early"""
+
+        # The first update is due one interval in, the command already showed the start
+        self.started = self._reported = time.monotonic()
+        try:
+            await self._purge()
+        except asyncio.CancelledError:
+            self.cancelled = True
+        except discord.HTTPException as e:
+            self.error = e
+        finally:
+            self.finished = time.monotonic()
+        await self._report(force=True)
+        return self.deleted
+
+    async def _purge(self):
+        limit = self.amount * SCAN_FACTOR if self.check else self.amount
+        cutoff = discord.utils.utcnow() - BULK_MAX_AGE
+        batch = []
+        async for message in self.channel.history(limit=limit, before=self.before,
+                                                  after=self.after, oldest_first=False):
+            self.scanned += 1
+            if not self.check(message):
+                continue
+            if message.created_at > cutoff:
+                batch.append(message)
+                if len(batch) == BULK_LIMIT:
+                    await self._delete_bulk(batch)
+                    batch = []
+            else:
+                # Bulk delete refuses anything older, history is newest first so
+                # everything from here on goes one by one
+                if batch:
+                    await self._delete_bulk(batch)
+                    batch = []
+                await self._delete_one(message)
+            if self.deleted + len(batch) >= self.amount:
+                break
+            await self._report()
+        if batch:
+            await self._delete_bulk(batch)
+
+    async def _delete_bulk(self, batch):
+        try:
+            await self.channel.delete_messages(batch)
+        except discord.NotFound:
+            # Someone else deleted part of the batch, retry the rest one by one
+            for message in batch:
+                await self._delete_one(message)
+            return
+        self.deleted += len(batch)
+        await self._report()
+
+    async def _delete_one(self, message):
+        try:
+            await message.delete()
+        except discord.NotFound:
+            return
+        self.deleted += 1
+
+    async def _report(self, force: bool = False):
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._reported < PROGRESS_INTERVAL:
+            return
+        self._reported = now
+        try:
+            await self.progress(self)
+        except discord.HTTPException:
+            pass
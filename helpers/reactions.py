@@ -0,0 +1,94 @@
+"""Contains the background reaction adder"""
+
+import asyncio
+import logging
+from collections import deque
+
+import discord
+
+log = logging.getLogger("tg9.reactions")
+
+MAX_RETRIES = 3  # Attempts per reaction after a 429
+RETRY_DELAY = 1.0  # Seconds to wait after a 429 without a retry_after
+
+_running = set()  # Strong references to worker tasks, the loop only keeps weak ones
+
+
+class ReactionPipeline:
+    """Adds reactions to one message in the background, in order
+
+    Reactions on a message share one rate limit bucket, so they go out one at a
+    time; the command that created the pipeline carries on immediately and can
+    wait for user interaction while the reactions are still being added.
+    """
+
+    def __init__(self, message: discord.Message):
+        self.message = message
+        self.pending = deque()
+        self.added = []
+        self.failed = []
+        self._task = None
+
+    def add(self, *emojis):
+        """Queue reactions, starts the worker if it is idle"""
+
+        self.pending.extend(emojis)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            _running.add(self._task)
+            self._task.add_done_callback(_running.discard)
+        return self
+
+    async def wait(self):
+        """Wait until every queued reaction was added or given up on"""
+
+        while self._task is not None and not self._task.done():
+            await asyncio.wait({self._task})
+
+    async def stop(self):
+        """Drop the reactions that were not added yet and wait for the one in flight
+
+        Unlike cancel(), a clear_reactions() right after this cannot race a
+        reaction that is still on its way and leave it behind.
+        """
+
+        self.pending.clear()
+        await self.wait()
+
+    def cancel(self):
+        """Drop the reactions that were not added yet"""
+
+        self.pending.clear()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while self.pending:
+            emoji = self.pending.popleft()
+            if await self._add(emoji):
+                self.added.append(emoji)
+            else:
+                self.failed.append(emoji)
+
+    async def _add(self, emoji):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                await self.message.add_reaction(emoji)
+                return True
+            except discord.RateLimited as e:
+                delay = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    # Missing permissions, deleted message, unknown emoji: not worth retrying
+                    log.warning("Could not add reaction %s: %s", emoji, e)
+                    return False
+                delay = RETRY_DELAY * (attempt + 1)
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(delay)
+        log.warning("Gave up adding reaction %s after %d retries", emoji, MAX_RETRIES)
+        return False
+
+
+def add_reactions(message: discord.Message, *emojis):
+    """Start adding reactions to a message without waiting for them"""
+    return ReactionPipeline(message).add(*emojis)
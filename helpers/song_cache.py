@@ -0,0 +1,213 @@
+"""Contains song metadata cache"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+from helpers.exceptions import ExtractionError
+from helpers.persistence import locked_update
+
+STREAM_TTL = 3600.0  # Used when a stream URL has no expire parameter
+STREAM_MARGIN = 300.0  # Treat stream URLs as stale this long before they expire
+
+
+def normalize(query: str):
+    """Cache key of a search string"""
+    return " ".join(query.casefold().split())
+
+
+def stream_expiry(url: str, now: float = None):
+    """Unix time at which a stream URL stops working"""
+
+    now = time.time() if now is None else now
+    try:
+        return float(parse_qs(urlparse(url).query)["expire"][0])
+    except (KeyError, IndexError, ValueError):
+        return now + STREAM_TTL
+
+
+def select_format(data: dict):
+    """Best audio-only format of youtube-dl info, Opus first since it is only remuxed
+
+    Returns None when nothing in data is playable.
+    """
+
+    audio = [fmt for fmt in data.get("formats") or ()
+             if fmt.get("url") and fmt.get("vcodec") == "none"
+             and fmt.get("acodec") not in (None, "none")]
+    if audio:
+        return max(audio, key=lambda fmt: (fmt.get("acodec") == "opus", fmt.get("abr") or 0))
+    # No audio-only format, e.g. direct links and livestreams, use what youtube-dl selected
+    if data.get("url"):
+        return data
+    playable = [fmt for fmt in data.get("formats") or () if fmt.get("url")]
+    return playable[-1] if playable else None
+
+
+class CacheStats:
+    """Hit and miss counters of the song cache"""
+
+    __slots__ = ("hits", "misses", "stale_streams", "evictions")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale_streams = 0
+        self.evictions = 0
+
+
+class SongCache:
+    """LRU cache of search string -> video id -> song metadata and stream URL"""
+
+    def __init__(self, max_searches: int = 4096, max_songs: int = 2048,
+                 search_ttl: float = 86400.0, path: str = None):
+        self.max_searches = max_searches
+        self.max_songs = max_songs
+        self.search_ttl = search_ttl
+        self.path = path
+        self.searches = OrderedDict()  # normalized query -> [video id, stored at]
+        self.songs = OrderedDict()  # video id -> song dict
+        self.stats = CacheStats()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create the cache from the `music` section of config.json"""
+
+        music = config.get("music", {})
+        cache = cls(max_searches=music.get("cache_searches", 4096),
+                    max_songs=music.get("cache_songs", 2048),
+                    search_ttl=music.get("cache_search_ttl", 86400.0),
+                    path=music.get("cache_file", "song_cache.json"))
+        cache.load()
+        return cache
+
+    def __len__(self):
+        return len(self.songs)
+
+    @staticmethod
+    def song_from_data(data: dict):
+        """Pick the cached fields out of youtube-dl info"""
+
+        fmt = select_format(data)
+        if fmt is None:
+            raise ExtractionError(f"Nothing playable found for `{data.get('title') or data['id']}`")
+        return {
+            "id": data["id"],
+            "title": data.get("title"),
+            "webpage_url": data.get("webpage_url"),
+            "duration": data.get("duration"),
+            "format": {
+                "url": fmt["url"],
+                "ext": fmt.get("ext"),
+                "acodec": fmt.get("acodec"),
+                "abr": fmt.get("abr"),
+            },
+            "expires": stream_expiry(fmt["url"]),
+        }
+
+    def get(self, query: str):
+        """Cached song for a search string, or None"""
+
+        key = normalize(query)
+        hit = self.searches.get(key)
+        if hit is None or hit[1] + self.search_ttl < time.time() or hit[0] not in self.songs:
+            self.stats.misses += 1
+            return None
+        self.searches.move_to_end(key)
+        self.stats.hits += 1
+        return self.get_song(hit[0])
+
+    def get_song(self, video_id: str):
+        """Cached song for a video id, or None"""
+
+        song = self.songs.get(video_id)
+        if song is not None:
+            self.songs.move_to_end(video_id)
+        return song
+
+    def is_fresh(self, song: dict, margin: float = STREAM_MARGIN):
+        """Whether the cached stream URL can still be played"""
+
+        if song["expires"] - margin > time.time():
+            return True
+        self.stats.stale_streams += 1
+        return False
+
+    def put(self, query: str, data: dict):
+        """Store youtube-dl info for a search string, returns the cached song"""
+
+        song = self.song_from_data(data)
+        self.songs[song["id"]] = song
+        self.songs.move_to_end(song["id"])
+        if query is not None:
+            key = normalize(query)
+            self.searches[key] = [song["id"], time.time()]
+            self.searches.move_to_end(key)
+        self._evict()
+        return song
+
+    def _evict(self):
+        while len(self.songs) > self.max_songs:
+            self.songs.popitem(last=False)
+            self.stats.evictions += 1
+        while len(self.searches) > self.max_searches:
+            self.searches.popitem(last=False)
+
+    def load(self):
+        """Restore a snapshot written by save()"""
+
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                snapshot = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        self.songs = OrderedDict((song["id"], song) for song in snapshot.get("songs", []))
+        self.searches = OrderedDict(snapshot.get("searches", []))
+        self._evict()
+
+    async def save(self):
+        """Write a snapshot to disk off the event loop, merged with other clusters' snapshots"""
+
+        if self.path is None:
+            return
+        songs = list(self.songs.values())
+        searches = list(self.searches.items())
+        max_songs, max_searches = self.max_songs, self.max_searches
+
+        def merge(data):
+            data = data if isinstance(data, dict) else {}
+            merged_songs = OrderedDict((song["id"], song) for song in data.get("songs", []))
+            for song in songs:
+                stored = merged_songs.pop(song["id"], None)
+                # Ours are the most recently used, the fresher stream URL wins
+                merged_songs[song["id"]] = (stored if stored is not None
+                                            and stored["expires"] > song["expires"] else song)
+            merged_searches = OrderedDict(data.get("searches", []))
+            for key, hit in searches:
+                stored = merged_searches.pop(key, None)
+                merged_searches[key] = stored if stored is not None and stored[1] > hit[1] else hit
+            return json.dumps({
+                "songs": list(merged_songs.values())[-max_songs:],
+                "searches": list(merged_searches.items())[-max_searches:],
+            })
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, locked_update, self.path, merge)
+
+    def summary(self):
+        """Counters and sizes for the owner"""
+
+        lookups = self.stats.hits + self.stats.misses
+        return {
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "hit_rate": self.stats.hits / lookups if lookups else 0.0,
+            "stale_streams": self.stats.stale_streams,
+            "evictions": self.stats.evictions,
+            "songs": len(self.songs),
+            "searches": len(self.searches),
+        }
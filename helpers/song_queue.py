@@ -0,0 +1,157 @@
+"""Contains the per-guild Song Queue"""
+
+import asyncio
+import itertools
+import random
+from collections import deque
+
+
+class SongQueue:
+    """Indexable async queue, get() waits until a song is available"""
+
+    def __init__(self):
+        self._items = deque()
+        self._getters = deque()
+        self._durations = {}  # id(item) -> duration counted in total_duration
+        self.total_duration = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __getitem__(self, index: int):
+        return self._items[index]
+
+    def empty(self):
+        """Whether there are no queued songs"""
+        return not self._items
+
+    def qsize(self):
+        """Number of queued songs"""
+        return len(self._items)
+
+    def _count(self, item):
+        duration = getattr(item, "duration", None) or 0
+        self._durations[id(item)] = duration
+        self.total_duration += duration
+
+    def _uncount(self, item):
+        self.total_duration -= self._durations.pop(id(item), 0)
+
+    def update_duration(self, item):
+        """Account for a duration that became known after the song was queued"""
+
+        if id(item) in self._durations:
+            self._uncount(item)
+            self._count(item)
+
+    def _wakeup_next(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
+
+    def put_nowait(self, item):
+        """Append a song"""
+
+        self._items.append(item)
+        self._count(item)
+        self._wakeup_next()
+
+    async def put(self, item):
+        """Append a song, kept for asyncio.Queue compatibility"""
+        self.put_nowait(item)
+
+    def get_nowait(self):
+        """Pop the next song, raises asyncio.QueueEmpty"""
+
+        if not self._items:
+            raise asyncio.QueueEmpty
+        item = self._items.popleft()
+        self._uncount(item)
+        return item
+
+    async def get(self):
+        """Pop the next song, waiting until one is queued"""
+
+        while not self._items:
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except:
+                getter.cancel()
+                try:
+                    self._getters.remove(getter)
+                except ValueError:
+                    pass
+                if self._items and not getter.cancelled():
+                    self._wakeup_next()
+                raise
+        return self.get_nowait()
+
+    def remove(self, index: int):
+        """Remove and return the song at index"""
+
+        item = self._items[index]
+        del self._items[index]
+        self._uncount(item)
+        return item
+
+    def move(self, index: int, to: int):
+        """Move the song at index to position to"""
+
+        item = self._items[index]
+        del self._items[index]
+        self._items.insert(to, item)
+        return item
+
+    def skip_to(self, index: int):
+        """Drop every song before index, returns how many were dropped"""
+
+        for _ in range(index):
+            self._uncount(self._items.popleft())
+        return index
+
+    def shuffle(self):
+        """Shuffle the queued songs"""
+
+        items = list(self._items)
+        random.shuffle(items)
+        self._items = deque(items)
+
+    def dedupe(self, key):
+        """Remove later duplicates by key(song), returns how many were removed"""
+
+        seen = set()
+        kept = deque()
+        for item in self._items:
+            value = key(item)
+            if value in seen:
+                self._uncount(item)
+                continue
+            seen.add(value)
+            kept.append(item)
+        removed = len(self._items) - len(kept)
+        self._items = kept
+        return removed
+
+    def clear(self):
+        """Remove every queued song"""
+
+        self._items.clear()
+        self._durations.clear()
+        self.total_duration = 0
+
+    def page(self, number: int, per_page: int = 10):
+        """Songs on a 1-based page with their 0-based positions"""
+
+        start = (number - 1) * per_page
+        return list(enumerate(itertools.islice(self._items, start, start + per_page), start))
+
+    def page_count(self, per_page: int = 10):
+        """Number of pages of per_page songs"""
+        return max(1, -(-len(self._items) // per_page))
@@ -0,0 +1,84 @@
+"""Contains startup timing"""
+
+import builtins
+import os
+import sys
+import threading
+import time
+
+
+def process_age():
+    """Seconds since this process started, 0 where /proc is not available"""
+
+    try:
+        with open("/proc/self/stat", encoding="utf-8") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", encoding="utf-8") as file:
+            uptime = float(file.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+STARTED_AT = time.perf_counter() - process_age()
+
+
+class ImportTimer:
+    """Times first imports of modules, excluding the time of nested imports"""
+
+    def __init__(self):
+        self.times = {}
+        self._local = threading.local()
+        self._original = None
+
+    def __enter__(self):
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, *_exc):
+        builtins.__import__ = self._original
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.times[name] = self.times.get(name, 0.0) + elapsed - nested
+
+
+class StartupReport:
+    """Where startup time went"""
+
+    def __init__(self):
+        self.extensions = {}  # name -> {"import": s, "setup": s}
+        self.failed = {}  # name -> error
+        self.imports = {}  # module -> s
+        self.setup_at = None
+        self.ready_at = None
+
+    def extension(self, name: str, stage: str, seconds: float):
+        """Record time spent on one stage of loading an extension"""
+        self.extensions.setdefault(name, {})[stage] = seconds
+
+    def setup_done(self):
+        """setup_hook finished"""
+        self.setup_at = time.perf_counter() - STARTED_AT
+
+    def ready(self):
+        """First on_ready"""
+
+        if self.ready_at is None:
+            self.ready_at = time.perf_counter() - STARTED_AT
+
+    def slowest_imports(self, count: int = 10):
+        """(module, seconds) sorted slowest first"""
+        return sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:count]
@@ -0,0 +1,66 @@
+"""Contains a hashed timer wheel for bulk expiry"""
+
+
+class TimerWheel:
+    """Keys with deadlines, bucketed by tick so expiring them never scans every key
+
+    A key sits in slot (deadline // tick) % slots. expire() visits only the
+    slots of the ticks that elapsed since the last call; keys whose deadline is
+    one or more revolutions away stay in their slot until a later pass.
+    A key expires up to one tick late.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots = slots
+        self.wheel = [set() for _ in range(slots)]
+        self.deadlines = {}  # key -> deadline
+        self._cursor = None  # Next tick to process
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def _slot(self, deadline: float):
+        return self.wheel[int(deadline // self.tick) % self.slots]
+
+    def schedule(self, key, deadline: float):
+        """Expire key at deadline, replacing an earlier schedule"""
+
+        old = self.deadlines.get(key)
+        if old is not None:
+            self._slot(old).discard(key)
+        if self._cursor is not None:
+            # Ticks before the cursor are not visited again, a deadline that
+            # already passed goes to the next pass
+            deadline = max(deadline, self._cursor * self.tick)
+        self.deadlines[key] = deadline
+        self._slot(deadline).add(key)
+
+    def cancel(self, key):
+        """Forget key, returns its deadline or None"""
+
+        deadline = self.deadlines.pop(key, None)
+        if deadline is not None:
+            self._slot(deadline).discard(key)
+        return deadline
+
+    def expire(self, now: float):
+        """Remove and return the keys that are due, processing only elapsed ticks"""
+
+        tick = int(now // self.tick)
+        if self._cursor is None:
+            self._cursor = tick - self.slots
+        # A slot is visited once its tick is over, so every key of this
+        # revolution in it is due; after a long gap one revolution covers all
+        due = []
+        for number in range(max(self._cursor, tick - self.slots), tick):
+            slot = self.wheel[number % self.slots]
+            for key in [key for key in slot if self.deadlines[key] <= now]:
+                slot.discard(key)
+                del self.deadlines[key]
+                due.append(key)
+        self._cursor = max(self._cursor, tick)
+        return due
@@ -0,0 +1,129 @@
+"""
+------------------------------------------------------------------------------
+Cluster launcher for Tg9 Bot
+
+Starts one bot.py process per cluster, each owning a range of shards, relays
+owner commands between them over a local socket and aggregates their health.
+
+    python launcher.py --clusters 2 --shards 8
+------------------------------------------------------------------------------
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+from helpers.ipc import IPCServer
+
+log = logging.getLogger("tg9.launcher")
+
+RESTART_BACKOFF_MAX = 60.0
+SHUTDOWN_GRACE = 15.0
+
+
+def shard_ranges(shard_count: int, clusters: int):
+    """Split shard IDs into contiguous ranges, one per cluster"""
+
+    size, extra = divmod(shard_count, clusters)
+    ranges, start = [], 0
+    for cluster_id in range(clusters):
+        end = start + size + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Launcher:
+    """Runs and restarts cluster processes"""
+
+    def __init__(self, clusters: int, shard_count: int):
+        self.ranges = shard_ranges(shard_count, clusters)
+        self.shard_count = shard_count
+        self.server = IPCServer()
+        self.processes = {}
+
+    async def run_cluster(self, cluster_id: int):
+        """Keep one cluster process running until shutdown"""
+
+        backoff = 1.0
+        while not self.server.shutdown_requested.is_set():
+            env = {
+                **os.environ,
+                "CLUSTER_ID": str(cluster_id),
+                "SHARD_IDS": ",".join(map(str, self.ranges[cluster_id])),
+                "SHARD_COUNT": str(self.shard_count),
+                "CLUSTER_COUNT": str(len(self.ranges)),
+                "CLUSTER_IPC": f"{self.server.host}:{self.server.port}",
+            }
+            process = await asyncio.create_subprocess_exec(sys.executable, "bot.py", env=env)
+            self.processes[cluster_id] = process
+            started = time.monotonic()
+            log.info("Started cluster %s (shards %s, pid %s)",
+                     cluster_id, self.ranges[cluster_id], process.pid)
+            code = await process.wait()
+            if self.server.shutdown_requested.is_set():
+                break
+            # Back off when a cluster keeps crashing right after start
+            backoff = 1.0 if time.monotonic() - started > RESTART_BACKOFF_MAX \
+                else min(backoff * 2, RESTART_BACKOFF_MAX)
+            log.warning("Cluster %s exited with %s, restarting in %.0fs",
+                        cluster_id, code, backoff)
+            await asyncio.sleep(backoff)
+        self.processes.pop(cluster_id, None)
+
+    async def report_health(self, interval: float = 60.0):
+        """Log the aggregated cluster health"""
+
+        while True:
+            await asyncio.sleep(interval)
+            log.info("Health %s", json.dumps(self.server.aggregate()))
+
+    async def shutdown(self):
+        """Ask every cluster to close, then terminate stragglers"""
+
+        self.server.shutdown_requested.set()
+        await self.server.broadcast("shutdown")
+        deadline = time.monotonic() + SHUTDOWN_GRACE
+        for process in list(self.processes.values()):
+            try:
+                await asyncio.wait_for(process.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                process.terminate()
+
+    async def run(self):
+        """Run until every cluster has exited after a shutdown"""
+
+        await self.server.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, lambda: loop.create_task(self.shutdown()))
+            except NotImplementedError:  # Windows
+                pass
+        health = loop.create_task(self.report_health())
+        try:
+            await asyncio.gather(*(self.run_cluster(i) for i in range(len(self.ranges))))
+        finally:
+            health.cancel()
+            await self.server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Tg9 Bot as several shard clusters")
+    parser.add_argument("--clusters", type=int, default=2)
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Total shard count, defaults to sharding.shard_count in config.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="[%(asctime)s] [%(levelname)-8s] %(name)s: %(message)s")
+    with open("config.json", encoding="utf-8") as file:
+        shards = args.shards or json.load(file).get("sharding", {}).get("shard_count")
+    if not shards or shards < args.clusters:
+        parser.error("need at least one shard per cluster, pass --shards")
+    asyncio.run(Launcher(args.clusters, shards).run())
@@ -0,0 +1,44 @@
+import asyncio
+import os
+
+from helpers.audio_cache import AudioCache
+from helpers.ffmpeg_budget import FFmpegBudget
+
+
+def run_fill(cache: AudioCache, video_id: str):
+    asyncio.run(cache._fill(video_id, "https://example.com/audio", "opus"))
+
+
+def test_failed_fill_is_counted_and_frees_the_slot(tmp_path):
+    budget = FFmpegBudget(max_processes=1)
+    cache = AudioCache(directory=str(tmp_path), budget=budget)
+
+    async def download(*_args):
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    cache._download = download
+    run_fill(cache, "a")
+    assert cache.failed == 1
+    assert not budget.leases
+    assert not cache.entries
+
+
+def test_shared_file_stays_until_last_reference(tmp_path):
+    cache = AudioCache(directory=str(tmp_path))
+
+    async def download(*_args):
+        path = cache._path("abc")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"x" * 10)
+        return "abc", 10
+
+    cache._download = download
+    for video_id in ("a", "b", "a"):
+        run_fill(cache, video_id)
+    assert cache.total_bytes == 10
+    cache._drop("a")
+    assert os.path.exists(cache._path("abc"))
+    cache._drop("b")
+    assert not os.path.exists(cache._path("abc"))
+    assert cache.total_bytes == 0
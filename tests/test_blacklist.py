@@ -0,0 +1,22 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from helpers.blacklist import Blacklist
+
+
+def test_malformed_edit_keeps_loaded_ids(tmp_path):
+    path = tmp_path / "blacklist.json"
+    path.write_text(json.dumps({"ids": [1, 2]}))
+    blacklist = Blacklist(str(path))
+    path.write_text(json.dumps({"users": [3]}))
+    os.utime(path, ns=(0, 1))  # A new mtime, even on coarse clocks
+
+    with pytest.raises(ValueError):
+        asyncio.run(blacklist.refresh())
+    assert set(blacklist) == {1, 2}
+    assert blacklist.document.data == {"ids": [1, 2]}
+    # Reported once, not again on every check
+    assert asyncio.run(blacklist.refresh()) is False
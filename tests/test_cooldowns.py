@@ -0,0 +1,59 @@
+from discord.ext import commands
+
+from helpers.cooldowns import PersistentCooldownMapping, merge_rows
+
+NOW = 1000.0
+PER = 60.0
+
+
+def test_later_window_wins():
+    stored = [[1, NOW - 30, 1], [2, NOW - 10, 1]]
+    rows = [[1, NOW - 5, 1], [2, NOW - 20, 1]]
+    assert sorted(merge_rows(stored, rows, PER, NOW)) == [[1, NOW - 5, 1], [2, NOW - 10, 1]]
+
+
+def test_more_uses_win_within_the_same_window():
+    stored = [[1, NOW - 5, 3]]
+    rows = [[1, NOW - 5, 1]]
+    assert merge_rows(stored, rows, PER, NOW) == [[1, NOW - 5, 3]]
+
+
+def test_expired_rows_are_dropped():
+    stored = [[1, NOW - 120, 1]]
+    rows = [[2, NOW - 61, 1], [3, NOW - 60, 1]]
+    assert merge_rows(stored, rows, PER, NOW) == [[3, NOW - 60, 1]]
+
+
+def test_reset_beats_an_older_stored_window():
+    stored = [[1, NOW - 30, 1], [2, NOW - 30, 1]]
+    forgotten = {1: NOW - 20}
+    assert merge_rows(stored, [], PER, NOW, forgotten) == [[2, NOW - 30, 1]]
+
+
+def test_stored_window_after_the_reset_survives():
+    stored = [[[1, 2], NOW - 10, 1]]
+    forgotten = {(1, 2): NOW - 20}
+    assert merge_rows(stored, [], PER, NOW, forgotten) == [[[1, 2], NOW - 10, 1]]
+
+
+def mapping(rate: int = 2):
+    return PersistentCooldownMapping(commands.Cooldown(rate, PER), lambda message: message)
+
+
+def test_rate_counts_uses_in_a_window():
+    cooldowns = mapping(rate=2)
+    bucket = cooldowns.get_bucket(7, NOW)
+    assert bucket.update_rate_limit(NOW) is None
+    assert bucket.update_rate_limit(NOW + 1) is None
+    assert bucket.update_rate_limit(NOW + 2) == PER - 2
+    assert cooldowns.get_bucket(7, NOW + PER + 1).get_tokens(NOW + PER + 1) == 2
+
+
+def test_reset_is_remembered_until_saved():
+    cooldowns = mapping(rate=1)
+    bucket = cooldowns.get_bucket((1, 2), NOW)
+    bucket.update_rate_limit(NOW)
+    bucket.reset()
+    assert len(cooldowns) == 0
+    assert (1, 2) in cooldowns.forgotten
+    assert bucket.get_tokens(NOW) == 1
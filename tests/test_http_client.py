@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from helpers.exceptions import HTTPRequestError
+from helpers.http_client import HTTPClient
+
+
+async def fetch(handler):
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = HTTPClient(retries=0)
+    await client.start()
+    try:
+        return await client.get_json(f"http://127.0.0.1:{port}/")
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def test_decodes_json():
+    async def handler(_request):
+        return web.json_response({"text": "fact"})
+
+    assert asyncio.run(fetch(handler)) == {"text": "fact"}
+
+
+def test_html_body_raises_request_error():
+    async def handler(_request):
+        return web.Response(text="<html>Bad gateway</html>", content_type="text/html")
+
+    with pytest.raises(HTTPRequestError, match="invalid JSON"):
+        asyncio.run(fetch(handler))
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+from helpers import persistence
+from helpers.persistence import JSONDocument
+
+
+def test_mutation_during_flush_is_written(tmp_path, monkeypatch):
+    path = tmp_path / "blacklist.json"
+    path.write_text(json.dumps({"ids": []}))
+    writing = threading.Event()
+    release = threading.Event()
+    atomic_write = persistence.atomic_write
+
+    def slow_write(target, payload):
+        writing.set()
+        release.wait(5)
+        return atomic_write(target, payload)
+
+    monkeypatch.setattr(persistence, "atomic_write", slow_write)
+
+    async def main():
+        document = JSONDocument(str(path), flush_delay=0)
+        await document.mutate(lambda data: data["ids"].append(1))
+        await asyncio.to_thread(writing.wait, 5)
+        await document.mutate(lambda data: data["ids"].append(2))
+        release.set()
+        await document._flush_task
+        return document
+
+    document = asyncio.run(main())
+    assert json.loads(path.read_text()) == {"ids": [1, 2]}
+    assert not document._dirty
+
+
+def test_mutations_are_batched_into_one_write(tmp_path, monkeypatch):
+    path = tmp_path / "blacklist.json"
+    path.write_text(json.dumps({"ids": []}))
+    writes = []
+    atomic_write = persistence.atomic_write
+
+    def counting_write(target, payload):
+        writes.append(payload)
+        return atomic_write(target, payload)
+
+    monkeypatch.setattr(persistence, "atomic_write", counting_write)
+
+    async def main():
+        document = JSONDocument(str(path), flush_delay=0.01)
+        for user_id in range(5):
+            await document.mutate(lambda data, user_id=user_id: data["ids"].append(user_id))
+        await document._flush_task
+
+    asyncio.run(main())
+    assert len(writes) == 1
+    assert json.loads(path.read_text()) == {"ids": [0, 1, 2, 3, 4]}
+
+
+def test_rejected_mutation_leaves_data_untouched(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"statuses": ["a"]}))
+
+    def validate(data):
+        if not data["statuses"]:
+            raise ValueError("at least one status")
+
+    async def main():
+        document = JSONDocument(str(path), flush_delay=0)
+        document.validator = validate
+        with pytest.raises(ValueError):
+            await document.mutate(lambda data: data["statuses"].clear())
+        return document
+
+    document = asyncio.run(main())
+    assert document.data == {"statuses": ["a"]}
+    assert document._flush_task is None
+
+
+def test_refresh_picks_up_external_edits_unless_dirty(tmp_path):
+    path = tmp_path / "blacklist.json"
+    path.write_text(json.dumps({"ids": [1]}))
+
+    async def main():
+        document = JSONDocument(str(path), flush_delay=60)
+        path.write_text(json.dumps({"ids": [2]}))
+        os.utime(path, ns=(0, 1))
+        assert await document.refresh()
+        assert document.data == {"ids": [2]}
+
+        await document.mutate(lambda data: data["ids"].append(3))
+        path.write_text(json.dumps({"ids": [4]}))
+        os.utime(path, ns=(0, 2))
+        # Our pending change wins over the external edit
+        assert not await document.refresh()
+        await document.flush()
+        return document
+
+    document = asyncio.run(main())
+    assert json.loads(path.read_text()) == {"ids": [2, 3]}
+    assert document.data == {"ids": [2, 3]}
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from helpers.purge import PurgeFilter, PurgeJob
+
+
+class Channel:
+    def __init__(self, messages):
+        self.messages = messages
+        self.deleted = []
+
+    async def history(self, *, limit, **_kwargs):
+        for message in self.messages[:limit]:
+            yield message
+
+    async def delete_messages(self, batch):
+        self.deleted.extend(batch)
+
+
+def message(author_id: int, content: str = "hello", bot: bool = False):
+    author = SimpleNamespace(id=author_id, bot=bot)
+    return SimpleNamespace(author=author, content=content, created_at=datetime.now(timezone.utc))
+
+
+def test_short_purge_reports_once():
+    channel = Channel([message(1) for _ in range(25)])
+    reports = []
+
+    async def progress(job):
+        reports.append(job.done)
+
+    job = PurgeJob(channel, 25, progress=progress)
+    assert asyncio.run(job.run()) == 25
+    assert reports == [True]
+
+
+def test_filter_scans_past_other_authors():
+    channel = Channel([message(1), message(2), message(1, "HELLO there"), message(2)])
+    job = PurgeJob(channel, 5, PurgeFilter(author=SimpleNamespace(id=2)))
+    asyncio.run(job.run())
+    assert job.scanned == 4
+    assert [m.author.id for m in channel.deleted] == [2, 2]
@@ -0,0 +1,29 @@
+import pytest
+
+from helpers.exceptions import ExtractionError
+from helpers.song_cache import SongCache, select_format
+
+
+def test_prefers_opus_audio():
+    data = {"formats": [
+        {"url": "a", "vcodec": "none", "acodec": "mp4a", "abr": 160},
+        {"url": "b", "vcodec": "none", "acodec": "opus", "abr": 128},
+        {"url": "c", "vcodec": "avc1", "acodec": "mp4a", "abr": 192},
+    ]}
+    assert select_format(data)["url"] == "b"
+
+
+@pytest.mark.parametrize("data", [
+    {"url": "direct"},
+    {"url": "direct", "formats": []},
+    {"url": "direct", "formats": None},
+])
+def test_direct_url_without_formats(data):
+    assert select_format(data) is data
+
+
+def test_nothing_playable():
+    assert select_format({"formats": []}) is None
+    assert select_format({}) is None
+    with pytest.raises(ExtractionError):
+        SongCache.song_from_data({"id": "x", "title": "Live"})
@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+from helpers.song_queue import SongQueue
+
+
+def song(title: str, duration: int = 60):
+    return SimpleNamespace(title=title, duration=duration)
+
+
+def queue_of(*titles):
+    queue = SongQueue()
+    for title in titles:
+        queue.put_nowait(song(title))
+    return queue
+
+
+def titles(queue: SongQueue):
+    return [item.title for item in queue]
+
+
+def test_move_and_remove():
+    queue = queue_of("a", "b", "c", "d")
+    assert queue.move(3, 0).title == "d"
+    assert titles(queue) == ["d", "a", "b", "c"]
+    assert queue.remove(1).title == "a"
+    assert titles(queue) == ["d", "b", "c"]
+    assert queue.total_duration == 180
+
+
+def test_skip_to_drops_earlier_songs():
+    queue = queue_of("a", "b", "c")
+    assert queue.skip_to(2) == 2
+    assert titles(queue) == ["c"]
+    assert queue.total_duration == 60
+
+
+def test_dedupe_keeps_first_occurrence():
+    queue = queue_of("a", "b", "a", "c", "b")
+    assert queue.dedupe(lambda item: item.title) == 2
+    assert titles(queue) == ["a", "b", "c"]
+    assert queue.total_duration == 180
+
+
+def test_update_duration_of_resolved_song():
+    queue = SongQueue()
+    item = song("a", duration=None)
+    queue.put_nowait(item)
+    assert queue.total_duration == 0
+    item.duration = 200
+    queue.update_duration(item)
+    assert queue.total_duration == 200
+    queue.get_nowait()
+    assert queue.total_duration == 0
+
+
+def test_pages():
+    queue = queue_of(*"abcdefghijkl")
+    assert queue.page_count() == 2
+    assert [(position, item.title) for position, item in queue.page(2)] == [(10, "k"), (11, "l")]
+    assert queue.page(3) == []
+    assert SongQueue().page_count() == 1
+
+
+def test_get_waits_for_a_song():
+    async def main():
+        queue = SongQueue()
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        queue.put_nowait(song("a"))
+        return await asyncio.wait_for(getter, 1)
+
+    assert asyncio.run(main()).title == "a"
+
+
+def test_cancelled_getter_passes_the_wakeup_on():
+    async def main():
+        queue = SongQueue()
+        first = asyncio.ensure_future(queue.get())
+        second = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        queue.put_nowait(song("a"))
+        first.cancel()
+        return await asyncio.wait_for(second, 1)
+
+    assert asyncio.run(main()).title == "a"
@@ -0,0 +1,50 @@
+from helpers.timer_wheel import TimerWheel
+
+
+def test_expires_due_keys_only():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.expire(100.0)
+    wheel.schedule("a", 102.5)
+    wheel.schedule("b", 105.0)
+    assert wheel.expire(102.0) == []
+    assert wheel.expire(103.0) == ["a"]
+    assert "b" in wheel and len(wheel) == 1
+    assert wheel.expire(106.0) == ["b"]
+
+
+def test_reschedule_and_cancel():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.expire(0.0)
+    wheel.schedule("a", 2.0)
+    wheel.schedule("a", 5.0)
+    assert wheel.expire(4.0) == []
+    assert wheel.cancel("a") == 5.0
+    assert wheel.cancel("a") is None
+    assert wheel.expire(10.0) == []
+
+
+def test_key_rounds_away_waits_for_its_revolution():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    wheel.expire(0.0)
+    # Same slot as tick 1, but two revolutions later
+    wheel.schedule("late", 9.5)
+    wheel.schedule("soon", 1.5)
+    assert wheel.expire(2.0) == ["soon"]
+    assert wheel.expire(6.0) == []
+    assert wheel.expire(10.0) == ["late"]
+
+
+def test_past_deadline_expires_on_the_next_pass():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.expire(50.0)
+    wheel.schedule("a", 10.0)
+    assert wheel.expire(51.0) == ["a"]
+
+
+def test_long_gap_expires_everything_due():
+    wheel = TimerWheel(tick=1.0, slots=4)
+    wheel.expire(0.0)
+    for number in range(10):
+        wheel.schedule(number, number + 0.5)
+    assert sorted(wheel.expire(100.0)) == list(range(10))
+    assert len(wheel) == 0